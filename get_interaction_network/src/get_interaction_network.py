@@ -0,0 +1,374 @@
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+
+# Interaction networks
+# --------------------
+# Turns the interaction and travel logs from `simulate` into networks, one set per simulation:
+#
+#   <output>/simulation_<id>/
+#       manifest.json              what's in here, node/edge/step counts
+#       nodes.npy                  agent unique_id of every node (node k is nodes[k], sorted)
+#       node_type.npy              index into manifest['agent_types'] (-1 if only ever seen as j)
+#       <type>/ and combined/      weighted adjacency as CSR: indptr.npy, indices.npy and one
+#                                  array per edge attribute, weight.npy (number of interactions),
+#                                  mean_difference.npy (mean ij_belief_difference) and
+#                                  update_fraction.npy (fraction of update_boolean), NaN where the
+#                                  log has no such column (journalists)
+#       temporal/<type>/           the same edges per step: i.npy, j.npy, weight.npy sorted by
+#                                  step, with step s in [step_ptr[s], step_ptr[s + 1])
+#       mobility/<type>/           cell to cell moves from the travel logs as CSR over cells.npy
+#                                  (the (x, y) of every cell anyone moved from or to)
+#
+# Everything is a plain .npy file, so np.load(..., mmap_mode='r') (or load_network below) opens
+# it without reading it into memory.
+#
+# Logs are read CHUNK_ROWS rows at a time, CSV or columnar. Memory goes with the number of
+# distinct edges (and the rows of one step, for the temporal slices), not with the size of the
+# logs: per-step edges are written out as soon as their step is complete.
+
+TASK_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INPUT_DIR = os.path.join(TASK_DIR, 'input')
+OUTPUT_DIR = os.path.join(TASK_DIR, 'output')
+
+AGENT_TYPES = ['scientists', 'journalists', 'policymakers', 'citizens', 'propagandists']
+CHUNK_ROWS = 1_000_000
+# pack an (x, y) grid cell into one int64
+CELL_KEY = 2**31
+
+
+def _open_column(filename, dtype=np.int64):
+    """
+    A raw binary column, memory-mapped (np.memmap can't map an empty file).
+    """
+    if os.path.getsize(filename) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(filename, dtype=dtype, mode='r')
+
+
+def read_stream(directory, stream, chunk_rows=CHUNK_ROWS):
+    """
+    Yield one log stream in chunks of at most chunk_rows rows, as {column: array}, whether
+    simulate wrote it as CSV (<stream>.csv) or columnar (a <stream>/ directory of raw columns).
+    """
+    path = os.path.join(directory, stream)
+    if os.path.isdir(path):
+        with open(os.path.join(path, 'schema.json')) as file:
+            schema = json.load(file)
+        columns = {}
+        for name, dtype in schema['columns']:
+            columns[name] = _open_column(os.path.join(path, f'{name}.bin'), dtype)
+        rows = min(len(c) for c in columns.values())
+        for start in range(0, rows, chunk_rows):
+            yield {name: np.asarray(c[start:start + chunk_rows]) for name, c in columns.items()}
+    elif os.path.exists(path + '.csv'):
+        for chunk in pd.read_csv(path + '.csv', chunksize=chunk_rows):
+            if len(chunk):
+                yield {name: chunk[name].to_numpy() for name in chunk.columns}
+
+
+def aggregate(keys, values):
+    """
+    Sum `values` (a tuple of arrays) over rows with the same `keys` (a tuple of arrays).
+    Returns the distinct keys, sorted lexicographically, and the sums.
+    """
+    if len(keys[0]) == 0:
+        return keys, values
+    order = np.lexsort(keys[::-1])
+    keys = tuple(k[order] for k in keys)
+    first = np.zeros(len(order), dtype=bool)
+    first[0] = True
+    for k in keys:
+        first[1:] |= k[1:] != k[:-1]
+    starts = np.flatnonzero(first)
+    return tuple(k[starts] for k in keys), tuple(np.add.reduceat(v[order], starts) for v in values)
+
+
+class EdgeAccumulator:
+    """
+    Running totals per (i, j) edge: interactions, interactions with a belief difference, the sum
+    of those differences and how many of them led to an update. Chunks are aggregated as they come
+    and merged into the totals in batches, so memory goes with the number of distinct edges.
+    """
+    merge_rows = CHUNK_ROWS
+
+    def __init__(self):
+        self.keys = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        self.values = tuple(np.empty(0) for _ in range(4))
+        self.pending = []
+        self.pending_rows = 0
+        self.rows = 0
+
+    def add(self, i, j, difference=None, update=None):
+        n = len(i)
+        ones = np.ones(n)
+        if difference is None:
+            values = (ones, np.zeros(n), np.zeros(n), np.zeros(n))
+        else:
+            values = (ones, ones, difference.astype(float), update.astype(float))
+        keys, values = aggregate((i.astype(np.int64), j.astype(np.int64)), values)
+        self.pending.append((keys, values))
+        self.pending_rows += len(keys[0])
+        self.rows += n
+        if self.pending_rows > max(len(self.keys[0]), self.merge_rows):
+            self._merge()
+
+    def _merge(self):
+        if not self.pending:
+            return
+        batches = [(self.keys, self.values)] + self.pending
+        keys = tuple(np.concatenate([b[0][k] for b in batches]) for k in range(2))
+        values = tuple(np.concatenate([b[1][k] for b in batches]) for k in range(4))
+        self.keys, self.values = aggregate(keys, values)
+        self.pending = []
+        self.pending_rows = 0
+
+    def merge(self, other):
+        other._merge()
+        self.pending.append((other.keys, other.values))
+        self.pending_rows += len(other.keys[0])
+        self.rows += other.rows
+
+    def result(self):
+        """
+        (i, j) sorted by i then j, and {attribute: array} for the edge attributes.
+        """
+        self._merge()
+        count, difference_count, difference_sum, update_sum = self.values
+        with np.errstate(invalid='ignore', divide='ignore'):
+            attributes = {
+                'weight': count.astype(np.int64),
+                'mean_difference': np.where(difference_count > 0, difference_sum / difference_count, np.nan),
+                'update_fraction': np.where(difference_count > 0, update_sum / difference_count, np.nan),
+                }
+        return self.keys, attributes
+
+
+class TemporalSlices:
+    """
+    Per-step edge weights for one agent type, written to disk as each step completes. Logs are
+    written in step order, so once a chunk contains step s + 1, step s is done.
+    """
+    columns = ('step', 'i', 'j', 'weight')
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.files = {name: open(os.path.join(directory, f'{name}.bin'), 'wb') for name in self.columns}
+        self.held = None # rows of the last (maybe still incomplete) step
+
+    def add(self, step, i, j):
+        step, i, j = step.astype(np.int64), i.astype(np.int64), j.astype(np.int64)
+        if self.held is not None:
+            step, i, j = (np.concatenate([h, c]) for h, c in zip(self.held, (step, i, j)))
+        if np.any(step[1:] < step[:-1]):
+            raise ValueError(f'Log rows for {self.directory} are not in step order')
+        done = step < step[-1]
+        self._write(step[done], i[done], j[done])
+        self.held = (step[~done], i[~done], j[~done])
+
+    def _write(self, step, i, j):
+        (step, i, j), (weight,) = aggregate((step, i, j), (np.ones(len(step), dtype=np.int64),))
+        for name, column in zip(self.columns, (step, i, j, weight)):
+            column.tofile(self.files[name])
+
+    def close(self):
+        if self.held is not None:
+            self._write(*self.held)
+            self.held = None
+        for file in self.files.values():
+            file.close()
+
+    def finalize(self, nodes):
+        """
+        Swap agent ids for node indexes, index the steps and leave everything as .npy.
+        """
+        step = _open_column(os.path.join(self.directory, 'step.bin'))
+        steps = int(step[-1]) + 1 if len(step) else 0
+        np.save(os.path.join(self.directory, 'step_ptr.npy'), np.searchsorted(step, np.arange(steps + 1)))
+        edges = len(step)
+        del step
+        for name in ('i', 'j', 'weight'):
+            source = os.path.join(self.directory, f'{name}.bin')
+            dtype = np.int64 if name == 'weight' else node_dtype(len(nodes))
+            out = np.lib.format.open_memmap(os.path.join(self.directory, f'{name}.npy'), mode='w+', dtype=dtype, shape=(edges,))
+            if edges:
+                column = _open_column(source)
+                for start in range(0, edges, CHUNK_ROWS):
+                    block = column[start:start + CHUNK_ROWS]
+                    out[start:start + CHUNK_ROWS] = block if name == 'weight' else np.searchsorted(nodes, block)
+                del column
+            out.flush()
+            del out
+        for name in self.columns:
+            os.remove(os.path.join(self.directory, f'{name}.bin'))
+        return {'edges': edges, 'steps': steps}
+
+
+class MobilityAccumulator:
+    """
+    Counts of moves between grid cells, one per agent per consecutive pair of travel log rows.
+    Remembers where every agent was last seen, so moves across chunk boundaries count too.
+    """
+    def __init__(self):
+        self.moves = EdgeAccumulator()
+        self.last_agent = np.empty(0, dtype=np.int64)
+        self.last_cell = np.empty(0, dtype=np.int64)
+
+    def add(self, agent, x, y, step):
+        agent = agent.astype(np.int64)
+        cell = x.astype(np.int64) * CELL_KEY + y.astype(np.int64)
+        order = np.lexsort((step, agent))
+        agent, cell = agent[order], cell[order]
+        first = np.ones(len(agent), dtype=bool)
+        first[1:] = agent[1:] != agent[:-1]
+
+        # moves within this chunk
+        source, destination = [cell[:-1][~first[1:]]], [cell[1:][~first[1:]]]
+        # moves from wherever each agent was at the end of the previous chunk
+        if len(self.last_agent):
+            pos = np.minimum(np.searchsorted(self.last_agent, agent[first]), len(self.last_agent) - 1)
+            seen = self.last_agent[pos] == agent[first]
+            source.append(self.last_cell[pos[seen]])
+            destination.append(cell[first][seen])
+        self.moves.add(np.concatenate(source), np.concatenate(destination))
+
+        # remember where everyone ended up, newest position wins
+        last = np.append(np.flatnonzero(first)[1:] - 1, len(agent) - 1)
+        agents = np.concatenate([self.last_agent, agent[last]])
+        cells = np.concatenate([self.last_cell, cell[last]])
+        order = np.argsort(agents, kind='stable')
+        agents, cells = agents[order], cells[order]
+        newest = np.append(agents[1:] != agents[:-1], True)
+        self.last_agent, self.last_cell = agents[newest], cells[newest]
+
+
+def node_dtype(n):
+    return np.int32 if n < 2**31 else np.int64
+
+
+def write_csr(directory, rows, cols, attributes, n):
+    """
+    Save a CSR matrix with n rows (rows/cols already sorted by row then column) and its edge
+    attributes, one .npy per array.
+    """
+    os.makedirs(directory, exist_ok=True)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    np.save(os.path.join(directory, 'indptr.npy'), indptr)
+    np.save(os.path.join(directory, 'indices.npy'), cols.astype(node_dtype(n)))
+    for name, values in attributes.items():
+        np.save(os.path.join(directory, f'{name}.npy'), values)
+
+
+def build_networks(log_dir, output_dir, chunk_rows=CHUNK_ROWS):
+    """
+    Build every network for one simulation's logs, returns the manifest.
+    """
+    if os.path.isdir(output_dir):
+        shutil.rmtree(output_dir)
+    os.makedirs(output_dir)
+
+    # ONE PASS OVER THE INTERACTION LOGS
+    edges, temporal = {}, {}
+    for agent_type in AGENT_TYPES:
+        stream = f'interactions_{agent_type}'
+        edges[agent_type] = EdgeAccumulator()
+        temporal[agent_type] = TemporalSlices(os.path.join(output_dir, 'temporal', agent_type))
+        for chunk in read_stream(log_dir, stream, chunk_rows):
+            if 'ij_belief_difference' in chunk:
+                edges[agent_type].add(chunk['i'], chunk['j'], chunk['ij_belief_difference'], chunk['update_boolean'])
+            else:
+                edges[agent_type].add(chunk['i'], chunk['j'])
+            temporal[agent_type].add(chunk['step'], chunk['i'], chunk['j'])
+        temporal[agent_type].close()
+
+    # NODES, everyone who interacted with anyone
+    results = {agent_type: accumulator.result() for agent_type, accumulator in edges.items()}
+    ids = [np.concatenate(keys) for keys, _ in results.values()]
+    nodes = np.unique(np.concatenate(ids)) if ids else np.empty(0, dtype=np.int64)
+    node_type = np.full(len(nodes), -1, dtype=np.int8)
+    for code, ((i, _), _) in enumerate(results.values()):
+        node_type[np.searchsorted(nodes, i)] = code
+    np.save(os.path.join(output_dir, 'nodes.npy'), nodes)
+    np.save(os.path.join(output_dir, 'node_type.npy'), node_type)
+
+    # WEIGHTED ADJACENCY PER TYPE AND COMBINED
+    manifest = {'agent_types': AGENT_TYPES, 'nodes': len(nodes), 'networks': {}, 'temporal': {}, 'mobility': {}}
+    combined = EdgeAccumulator()
+    for agent_type, ((i, j), attributes) in results.items():
+        write_csr(os.path.join(output_dir, agent_type), np.searchsorted(nodes, i), np.searchsorted(nodes, j), attributes, len(nodes))
+        manifest['networks'][agent_type] = {'edges': len(i), 'interactions': edges[agent_type].rows}
+        combined.merge(edges[agent_type])
+    (i, j), attributes = combined.result()
+    write_csr(os.path.join(output_dir, 'combined'), np.searchsorted(nodes, i), np.searchsorted(nodes, j), attributes, len(nodes))
+    manifest['networks']['combined'] = {'edges': len(i), 'interactions': combined.rows}
+
+    # TEMPORAL SLICES
+    for agent_type, slices in temporal.items():
+        manifest['temporal'][agent_type] = slices.finalize(nodes)
+
+    # MOBILITY
+    for agent_type in AGENT_TYPES:
+        mobility = MobilityAccumulator()
+        for chunk in read_stream(log_dir, f'travel_{agent_type}', chunk_rows):
+            mobility.add(chunk['agent'], chunk['x'], chunk['y'], chunk['step'])
+        (source, destination), attributes = mobility.moves.result()
+        cells = np.union1d(source, destination)
+        directory = os.path.join(output_dir, 'mobility', agent_type)
+        write_csr(directory, np.searchsorted(cells, source), np.searchsorted(cells, destination), {'weight': attributes['weight']}, len(cells))
+        np.save(os.path.join(directory, 'cells.npy'), np.stack([cells // CELL_KEY, cells % CELL_KEY], axis=1))
+        manifest['mobility'][agent_type] = {'cells': len(cells), 'edges': len(source), 'moves': mobility.moves.rows}
+
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def find_log_dirs(input_dir=INPUT_DIR):
+    """
+    {name: directory} for every simulation's logs: logs/simulation_<id>/ from an ensemble, or
+    logs sitting directly in the input directory (named 'simulation').
+    """
+    log_dirs = {}
+    logs = os.path.join(input_dir, 'logs')
+    if os.path.isdir(logs):
+        for name in sorted(os.listdir(logs)):
+            if name.startswith('simulation_') and os.path.isdir(os.path.join(logs, name)):
+                log_dirs[name] = os.path.join(logs, name)
+    if any(name.startswith('interactions_') for name in os.listdir(input_dir)):
+        log_dirs['simulation'] = input_dir
+    return log_dirs
+
+
+def load_network(directory, network='combined', attribute='weight'):
+    """
+    One network as a scipy.sparse CSR matrix, memory-mapped from disk. `network` is an agent
+    type, 'combined', or 'mobility/<type>'.
+    """
+    from scipy import sparse
+    path = os.path.join(directory, network)
+    indptr = np.load(os.path.join(path, 'indptr.npy'), mmap_mode='r')
+    indices = np.load(os.path.join(path, 'indices.npy'), mmap_mode='r')
+    data = np.load(os.path.join(path, f'{attribute}.npy'), mmap_mode='r')
+    n = len(indptr) - 1
+    return sparse.csr_matrix((data, indices, indptr), shape=(n, n), copy=False)
+
+
+def load_step(directory, agent_type, step):
+    """
+    (i, j, weight) node-index edges of one agent type's interactions at one step.
+    """
+    path = os.path.join(directory, 'temporal', agent_type)
+    step_ptr = np.load(os.path.join(path, 'step_ptr.npy'))
+    start, stop = step_ptr[step], step_ptr[step + 1]
+    return tuple(np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')[start:stop] for name in ('i', 'j', 'weight'))
+
+
+if __name__ == '__main__':
+    log_dirs = find_log_dirs()
+    for name, log_dir in log_dirs.items():
+        manifest = build_networks(log_dir, os.path.join(OUTPUT_DIR, name))
+        print(name, manifest['nodes'], 'nodes,', manifest['networks']['combined']['edges'], 'edges')
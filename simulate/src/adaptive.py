@@ -0,0 +1,144 @@
+import os
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from ensemble import run_replicate, replicate_seeds, LOG_DIR
+
+# Adaptive ensembles
+# ------------------
+# With `ensemble: adaptive` simulate.py doesn't run a fixed `number_of_simulations`. It runs
+# replicates in batches of `adaptive_batch` (default: one per worker) and after every batch works
+# out a confidence interval (level `adaptive_confidence`, Student's t) for each outcome in
+# `adaptive_outcomes`, across the replicates so far. It stops as soon as every interval is at most
+# `adaptive_target_width` wide (a number, or {outcome: width}), once it has at least
+# `adaptive_min_simulations` replicates, or when it hits `adaptive_max_simulations`.
+#
+# Outcomes are read off each replicate's last collected step:
+#
+#   final_mean_citizen_belief         mean citizen belief
+#   final_mean_policymaker_belief     mean policymaker belief
+#   policymakers_above_half           share of policymakers with belief > 0.5
+#   final_mean_scientist_posterior    mean scientist posterior mean
+#
+# Replicate i gets the same seed it would in a fixed ensemble (see ensemble.replicate_seeds), so
+# an adaptive run that stops at n replicates is the first n replicates of the fixed one. The
+# report (output/adaptive.csv) has one row per outcome: how many replicates it took, the mean,
+# the interval, and whether the target was met.
+
+ADAPTIVE_REPORT = 'adaptive.csv'
+BELIEF = 'Belief (After All Step Actions)'
+
+
+def _final(agent_beliefs, agent_type, column):
+    df = agent_beliefs[agent_beliefs['Agent Type'] == agent_type]
+    return df.loc[df['Step'] == df['Step'].max(), column]
+
+
+OUTCOMES = {
+    'final_mean_citizen_belief': lambda df: _final(df, 'Citizen', BELIEF).mean(),
+    'final_mean_policymaker_belief': lambda df: _final(df, 'Policymaker', BELIEF).mean(),
+    'policymakers_above_half': lambda df: (_final(df, 'Policymaker', BELIEF) > 0.5).mean(),
+    'final_mean_scientist_posterior': lambda df: _final(df, 'Scientist', 'Posterior Mean').mean(),
+    }
+
+
+def interval(values, confidence):
+    """
+    (mean, half width) of a t confidence interval for the mean of `values`.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n < 2:
+        return (values.mean() if n else np.nan), np.inf
+    t = stats.t.ppf((1 + confidence) / 2, n - 1)
+    return values.mean(), t * values.std(ddof=1) / np.sqrt(n)
+
+
+class AdaptiveEnsemble:
+    """
+    Runs replicates in batches until the outcomes are pinned down (see above). Iterate over
+    run() like run_ensemble; `outcomes` has one row per finished replicate, report() the
+    intervals so far.
+    """
+    def __init__(self, params):
+        self.params = params
+        self.names = list(params['adaptive_outcomes'])
+        unknown = [name for name in self.names if name not in OUTCOMES]
+        if unknown:
+            raise ValueError(f'Unknown adaptive_outcomes {unknown}, expected some of {list(OUTCOMES)}')
+        target = params['adaptive_target_width']
+        self.targets = {name: target[name] if isinstance(target, dict) else target for name in self.names}
+        self.confidence = params['adaptive_confidence']
+        self.batch = params['adaptive_batch'] or params['workers']
+        self.min_simulations = params['adaptive_min_simulations']
+        self.max_simulations = params['adaptive_max_simulations']
+        self.rows = []
+
+    @property
+    def outcomes(self):
+        return pd.DataFrame(self.rows, columns=['SimulationID'] + self.names)
+
+    def report(self):
+        outcomes = self.outcomes
+        rows = []
+        for name in self.names:
+            mean, half_width = interval(outcomes[name].dropna(), self.confidence)
+            rows.append({
+                'outcome': name,
+                'replicates': len(outcomes),
+                'mean': mean,
+                'lower': mean - half_width,
+                'upper': mean + half_width,
+                'width': 2 * half_width,
+                'target_width': self.targets[name],
+                'met': 2 * half_width <= self.targets[name],
+                })
+        return pd.DataFrame(rows)
+
+    def done(self):
+        n = len(self.rows)
+        if n >= self.max_simulations:
+            return True
+        return n >= self.min_simulations and self.report()['met'].all()
+
+    def record(self, simulation_id, agent_beliefs):
+        self.rows.append([simulation_id] + [OUTCOMES[name](agent_beliefs) for name in self.names])
+
+    def run(self, seed=None, workers=1, chunksize=1, log_dir=LOG_DIR, trajectory_dir=None):
+        """
+        Yield (simulation_id, agent_beliefs) in SimulationID order, batch after batch, until done.
+        """
+        seeds = replicate_seeds(seed, self.max_simulations)
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            start = 0
+            while not self.done():
+                # at least enough to reach the minimum, never past the maximum
+                stop = min(max(start + self.batch, self.min_simulations), self.max_simulations)
+                simulation_ids = range(start, stop)
+                if executor is None:
+                    results = (
+                        run_replicate(i, seeds[i], self.params, log_dir, trajectory_dir) for i in simulation_ids
+                        )
+                else:
+                    results = executor.map(
+                        run_replicate, simulation_ids, seeds[start:stop], repeat(self.params), repeat(log_dir),
+                        repeat(trajectory_dir), chunksize=chunksize
+                        )
+                for simulation_id, agent_beliefs in results:
+                    self.record(simulation_id, agent_beliefs)
+                    yield simulation_id, agent_beliefs
+                start = stop
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+
+def write_report(ensemble, output_dir):
+    path = os.path.join(output_dir, ADAPTIVE_REPORT)
+    ensemble.report().to_csv(path, index=False)
+    return path
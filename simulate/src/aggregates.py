@@ -0,0 +1,211 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Online aggregates
+# -----------------
+# With `aggregates: true` a World summarizes every agent type's beliefs as it goes, instead of
+# (or as well as, see `collect_agents`) recording every agent at every step. For each step, type
+# and variable (belief for everyone, posterior_mean for scientists too) it keeps a small sketch:
+#
+#   count, mean, M2     for the mean and variance (merged with Chan et al.'s pairwise formula)
+#   min, max
+#   histogram           `aggregate_bins` equal bins over [0, 1], for the quantiles
+#   above               how many are above each of `aggregate_thresholds`, and above 0.5
+#
+# Sketches merge exactly (counts add, means and M2 combine), so the replicates of an ensemble
+# add up to the same sketch as one big run with all their agents. Each replicate writes its
+# sketches to log_dir/simulation_<id>/aggregates.csv, and simulate.py merges them into
+#
+#   aggregates.csv            one row per replicate, step, type and variable
+#   aggregates_ensemble.csv   one row per step, type and variable, all replicates together
+#
+# with Count, Mean, Std, Min, Max, quantiles Q10..Q90 (interpolated within histogram bins, so
+# good to 1 / aggregate_bins), Share Above <t> for each threshold, and Consensus, the share on
+# the majority side of 0.5 (1 = everyone agrees, 0.5 = an even split).
+
+AGGREGATED = (
+    ('Scientist', 'posterior_mean'), ('Scientist', 'belief'), ('Journalist', 'belief'),
+    ('Propagandist', 'belief'), ('Citizen', 'belief'), ('Policymaker', 'belief'),
+    )
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+KEYS = ['Step', 'Agent Type', 'Variable']
+
+
+def aggregates_path(log_dir, simulation_id):
+    return os.path.join(log_dir, f'simulation_{simulation_id}', 'aggregates.csv')
+
+
+class Sketch:
+    """
+    Mergeable summary of one set of values in [0, 1].
+    """
+    def __init__(self, bins, thresholds):
+        self.thresholds = np.asarray(thresholds, dtype=float)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.histogram = np.zeros(bins, dtype=np.int64)
+        self.above = np.zeros(len(self.thresholds), dtype=np.int64)
+        self.above_half = 0
+
+    def add(self, values):
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        other = Sketch(len(self.histogram), self.thresholds)
+        other.count = len(values)
+        other.mean = values.mean()
+        other.m2 = ((values - other.mean) ** 2).sum()
+        other.min = values.min()
+        other.max = values.max()
+        bins = len(self.histogram)
+        which = np.minimum((np.clip(values, 0, 1) * bins).astype(np.int64), bins - 1)
+        other.histogram = np.bincount(which, minlength=bins)
+        other.above = (values[:, None] > self.thresholds[None, :]).sum(axis=0)
+        other.above_half = int((values > 0.5).sum())
+        self.merge(other)
+
+    def merge(self, other):
+        if other.count == 0:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.histogram = self.histogram + other.histogram
+        self.above = self.above + other.above
+        self.above_half += other.above_half
+        return self
+
+    def quantile(self, q):
+        """
+        The q-quantile, interpolated linearly within its histogram bin.
+        """
+        if self.count == 0:
+            return np.nan
+        bins = len(self.histogram)
+        cumulative = np.cumsum(self.histogram)
+        target = q * self.count
+        k = min(int(np.searchsorted(cumulative, target)), bins - 1)
+        below = cumulative[k - 1] if k else 0
+        within = (target - below) / self.histogram[k] if self.histogram[k] else 0.0
+        return float(np.clip((k + within) / bins, self.min, self.max))
+
+    def summary(self):
+        row = {
+            'Count': self.count,
+            'Mean': self.mean if self.count else np.nan,
+            'Std': np.sqrt(self.m2 / self.count) if self.count else np.nan,
+            'Min': self.min if self.count else np.nan,
+            'Max': self.max if self.count else np.nan,
+            }
+        for q in QUANTILES:
+            row[f'Q{int(q * 100)}'] = self.quantile(q)
+        for threshold, above in zip(self.thresholds, self.above):
+            row[f'Share Above {threshold:g}'] = above / self.count if self.count else np.nan
+        half = self.above_half / self.count if self.count else np.nan
+        row['Consensus'] = max(half, 1 - half)
+        return row
+
+    def state(self):
+        row = {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max, 'above_half': self.above_half}
+        row.update({f'histogram_{k}': n for k, n in enumerate(self.histogram)})
+        row.update({f'above_{threshold:g}': n for threshold, n in zip(self.thresholds, self.above)})
+        return row
+
+    @classmethod
+    def from_state(cls, row, bins, thresholds):
+        sketch = cls(bins, thresholds)
+        sketch.count = int(row['count'])
+        sketch.mean, sketch.m2 = float(row['mean']), float(row['m2'])
+        sketch.min, sketch.max = float(row['min']), float(row['max'])
+        sketch.above_half = int(row['above_half'])
+        sketch.histogram = np.array([row[f'histogram_{k}'] for k in range(bins)], dtype=np.int64)
+        sketch.above = np.array([row[f'above_{threshold:g}'] for threshold in sketch.thresholds], dtype=np.int64)
+        return sketch
+
+
+class Aggregates:
+    """
+    A World's sketches, one per (step, agent type, variable), see above.
+    """
+    def __init__(self, bins=50, thresholds=(0.5,)):
+        self.bins = bins
+        self.thresholds = tuple(thresholds)
+        self.sketches = {}
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(params['aggregate_bins'], params['aggregate_thresholds'])
+
+    def update(self, model, step):
+        registry = model.registry
+        for agent_type, name in AGGREGATED:
+            if registry.count(agent_type) == 0:
+                continue
+            if agent_type in registry.populations and not hasattr(registry.populations[agent_type], name):
+                continue
+            sketch = Sketch(self.bins, self.thresholds)
+            sketch.add(np.asarray(registry.values(agent_type, name), dtype=float))
+            self.sketches[step, agent_type, name] = sketch
+
+    def merge(self, other):
+        """
+        Add another run's sketches to these (same bins and thresholds).
+        """
+        for key, sketch in other.sketches.items():
+            if key in self.sketches:
+                self.sketches[key].merge(sketch)
+            else:
+                self.sketches[key] = sketch
+        return self
+
+    def state(self):
+        """
+        The sketches as a table, one row each, which from_state() reads back.
+        """
+        rows = [{**dict(zip(KEYS, key)), **sketch.state()} for key, sketch in sorted(self.sketches.items())]
+        return pd.DataFrame(rows)
+
+    @classmethod
+    def from_state(cls, df, thresholds):
+        bins = sum(1 for column in df.columns if column.startswith('histogram_'))
+        aggregates = cls(bins, thresholds)
+        for row in df.to_dict('records'):
+            key = tuple(row[k] for k in KEYS)
+            aggregates.sketches[key] = Sketch.from_state(row, bins, thresholds)
+        return aggregates
+
+    def summary(self):
+        rows = [{**dict(zip(KEYS, key)), **sketch.summary()} for key, sketch in sorted(self.sketches.items())]
+        return pd.DataFrame(rows)
+
+
+def combine_aggregates(paths, thresholds, output_dir):
+    """
+    Summaries of the per-replicate sketches ({simulation_id: path}), each on its own
+    (aggregates.csv) and all merged (aggregates_ensemble.csv). Replicates without sketches are
+    skipped. Returns the two paths.
+    """
+    frames, merged = [], None
+    for simulation_id, path in paths.items():
+        if not os.path.exists(path):
+            continue
+        aggregates = Aggregates.from_state(pd.read_csv(path), thresholds)
+        df = aggregates.summary()
+        df.insert(0, 'SimulationID', simulation_id)
+        frames.append(df)
+        merged = aggregates if merged is None else merged.merge(aggregates)
+    per_replicate = os.path.join(output_dir, 'aggregates.csv')
+    ensemble = os.path.join(output_dir, 'aggregates_ensemble.csv')
+    if frames:
+        pd.concat(frames, ignore_index=True).to_csv(per_replicate, index=False)
+        merged.summary().to_csv(ensemble, index=False)
+    return per_replicate, ensemble
@@ -0,0 +1,317 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import itertools
+import multiprocessing
+from contextlib import contextmanager
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from config import load_config, OUTPUT_DIR
+from ensemble import build_world
+from logsink import LogSink, NullSink
+from collector import TypedCollector
+from scientists import BayesianScientist
+from journalists import Journalist
+from propagandists import Propagandist
+from citizens import Citizen
+from policymakers import Policymaker
+from citizen_population import CitizenPopulation
+from scientist_population import ScientistPopulation, beta_mean
+
+# World.step benchmarks
+# ---------------------
+# Builds a World for every combination of population size, type mix and grid size, runs a few
+# steps and records
+#
+#   - step throughput (steps and agent-steps per second, median over the timed steps)
+#   - seconds per step spent in each agent type's step (and in the data collector)
+#   - peak memory (max RSS of the process, each scenario runs in a fresh one)
+#
+# and the scaling exponent b in  seconds_per_step ~ agents ** b  for each agent type, fitted over
+# the population sizes. Results go to a JSON file, which a later run can be compared against:
+#
+#     python benchmark.py --sizes 500 1000 2000 --save baseline.json
+#     python benchmark.py --sizes 500 1000 2000 --baseline baseline.json
+#
+# `--agreement` instead checks that the array-backed scientists (ScientistPopulation) behave like
+# the reference BayesianScientist: it runs both over the same seeds and, at every step, compares
+# the mean posterior mean and the mean log10 concentration (alpha + beta) across seeds. The two
+# use their random numbers differently, so they can only agree in distribution. Any step where
+# the means are more than `--agreement-tolerance` standard errors apart counts as a disagreement.
+#
+# Offline, standard library plus what the model already needs.
+
+# number of each agent type per citizen
+MIXES = {
+    'default': {'num_scientists': 0.1, 'num_journalists': 0.06, 'num_propagandists': 0.06, 'num_policymakers': 0.05},
+    'media-heavy': {'num_scientists': 0.1, 'num_journalists': 0.3, 'num_propagandists': 0.3, 'num_policymakers': 0.05},
+    'science-heavy': {'num_scientists': 0.5, 'num_journalists': 0.06, 'num_propagandists': 0.06, 'num_policymakers': 0.05},
+    }
+# every type samples up to 9 stories / partners from the others, so keep at least this many
+MINIMUM_COUNT = 10
+
+# what we time for each agent type (the classes whose step() makes up World.step)
+TIMED = {
+    'Scientist': [(BayesianScientist, 'step'), (ScientistPopulation, 'step')],
+    'Journalist': [(Journalist, 'step')],
+    'Propagandist': [(Propagandist, 'step')],
+    'Citizen': [(Citizen, 'step'), (CitizenPopulation, 'step'), (CitizenPopulation, 'staged_step')],
+    'Policymaker': [(Policymaker, 'step')],
+    'collect': [(TypedCollector, 'collect')],
+    }
+COUNT_KEYS = {
+    'Scientist': 'num_scientists', 'Journalist': 'num_journalists', 'Propagandist': 'num_propagandists',
+    'Citizen': 'num_citizens', 'Policymaker': 'num_policymakers',
+    }
+
+
+@contextmanager
+def timed_methods(totals):
+    """
+    Add the wall time of every TIMED method call to totals[name] while inside the block.
+    """
+    originals = []
+    for name, methods in TIMED.items():
+        for cls, attribute in methods:
+            original = getattr(cls, attribute)
+            originals.append((cls, attribute, original))
+
+            def timed(*args, _original=original, _name=name, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return _original(*args, **kwargs)
+                finally:
+                    totals[_name] += time.perf_counter() - start
+            setattr(cls, attribute, timed)
+    try:
+        yield totals
+    finally:
+        for cls, attribute, original in originals:
+            setattr(cls, attribute, original)
+
+
+def scenario_params(citizens, mix, grid, vectorized, steps, schedule='random', threads=1):
+    counts = {key: max(int(round(share * citizens)), MINIMUM_COUNT) for key, share in MIXES[mix].items()}
+    return {
+        'num_citizens': citizens, **counts,
+        'grid_width': grid, 'grid_height': grid,
+        'vectorized_citizens': vectorized, 'vectorized_scientists': vectorized,
+        'steps_per_model': steps,
+        'schedule': schedule, 'threads': threads,
+        }
+
+
+def run_scenario(overrides, warmup, steps, seed):
+    """
+    Build a World and time its steps. Runs in its own process, so max RSS is this scenario's.
+    """
+    params = load_config(**overrides)
+    totals = {name: 0.0 for name in TIMED}
+    with tempfile.TemporaryDirectory() as log_dir, LogSink(log_dir) as log_sink:
+        start = time.perf_counter()
+        world = build_world(params, seed, log_sink)
+        build_seconds = time.perf_counter() - start
+        for _ in range(warmup):
+            world.step()
+        step_seconds = []
+        with timed_methods(totals):
+            for _ in range(steps):
+                start = time.perf_counter()
+                world.step()
+                step_seconds.append(time.perf_counter() - start)
+            log_sink.flush()
+    agents = sum(params[key] for key in COUNT_KEYS.values())
+    median = float(np.median(step_seconds))
+    return {
+        'build_seconds': build_seconds,
+        'step_seconds': step_seconds,
+        'steps_per_second': 1 / median,
+        'agent_steps_per_second': agents / median,
+        'per_type_seconds_per_step': {name: total / steps for name, total in totals.items()},
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, # KB on Linux
+        }
+
+
+def scaling_exponents(scenarios):
+    """
+    For each (mix, grid, vectorized) group with at least two population sizes, the slope of
+    log(seconds per step) against log(agents of that type), per agent type.
+    """
+    groups = {}
+    for scenario in scenarios:
+        key = (scenario['mix'], scenario['grid'], scenario['vectorized'])
+        groups.setdefault(key, []).append(scenario)
+    exponents = []
+    for (mix, grid, vectorized), group in groups.items():
+        if len({s['citizens'] for s in group}) < 2:
+            continue
+        row = {'mix': mix, 'grid': grid, 'vectorized': vectorized, 'exponents': {}}
+        for name, key in COUNT_KEYS.items():
+            x = np.array([s['params'][key] for s in group], dtype=float)
+            y = np.array([s['per_type_seconds_per_step'][name] for s in group])
+            if len(np.unique(x)) > 1 and np.all(y > 0):
+                row['exponents'][name] = float(np.polyfit(np.log(x), np.log(y), 1)[0])
+        x = np.array([sum(s['params'][k] for k in COUNT_KEYS.values()) for s in group], dtype=float)
+        y = np.array([np.median(s['step_seconds']) for s in group])
+        row['exponents']['World.step'] = float(np.polyfit(np.log(x), np.log(y), 1)[0])
+        exponents.append(row)
+    return exponents
+
+
+def compare(results, baseline, tolerance):
+    """
+    Median step time of every scenario that's also in the baseline, relative to the baseline.
+    Returns the comparisons and the names of the scenarios more than `tolerance` slower.
+    """
+    before = {s['name']: s for s in baseline['scenarios']}
+    comparisons, regressions = [], []
+    for scenario in results['scenarios']:
+        if scenario['name'] not in before:
+            continue
+        ratio = np.median(scenario['step_seconds']) / np.median(before[scenario['name']]['step_seconds'])
+        comparisons.append({
+            'name': scenario['name'], 'ratio': float(ratio),
+            'peak_rss_ratio': scenario['peak_rss_mb'] / before[scenario['name']]['peak_rss_mb'],
+            })
+        if ratio > 1 + tolerance:
+            regressions.append(scenario['name'])
+    return comparisons, regressions
+
+
+def _scientist_posteriors(world):
+    # (alpha, beta) of every scientist's posterior, whichever implementation the world uses
+    if world.scientists is not None:
+        return world.scientists.posterior_alpha, world.scientists.posterior_beta
+    posteriors = np.array([agent.posterior for agent in world.registry.agents('Scientist')], dtype=float)
+    return posteriors[:, 0], posteriors[:, 1]
+
+
+def scientist_agreement(seeds=30, steps=10, num_scientists=50, tolerance=4.0):
+    """
+    Run BayesianScientist and ScientistPopulation over the same `seeds` for `steps` steps (see
+    above). Returns one row per step and statistic, and whether they all agree.
+    """
+    statistics = {}
+    for vectorized in (False, True):
+        params = load_config(
+            num_scientists=num_scientists, num_citizens=MINIMUM_COUNT, num_journalists=MINIMUM_COUNT,
+            num_propagandists=MINIMUM_COUNT, num_policymakers=MINIMUM_COUNT, steps_per_model=steps,
+            vectorized_scientists=vectorized, collect_agents=False, convergence=False, aggregates=False,
+            )
+        values = np.zeros((seeds, steps, 2))
+        for seed in range(seeds):
+            world = build_world(params, seed, NullSink())
+            for step in range(steps):
+                world.step()
+                alpha, beta = _scientist_posteriors(world)
+                values[seed, step] = beta_mean(alpha, beta).mean(), np.log10(alpha + beta).mean()
+        statistics[vectorized] = values
+    rows = []
+    for step in range(steps):
+        for k, name in enumerate(['posterior_mean', 'log10_concentration']):
+            reference, vectorized = statistics[False][:, step, k], statistics[True][:, step, k]
+            standard_error = np.sqrt(reference.var(ddof=1) / seeds + vectorized.var(ddof=1) / seeds)
+            z = abs(reference.mean() - vectorized.mean()) / standard_error if standard_error > 0 else 0.0
+            rows.append({
+                'step': step + 1, 'statistic': name, 'reference': float(reference.mean()),
+                'vectorized': float(vectorized.mean()), 'z': float(z),
+                })
+    return rows, all(row['z'] <= tolerance for row in rows)
+
+
+def environment():
+    return {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        }
+
+
+def run_benchmarks(sizes, mixes, grids, vectorized, warmup=1, steps=3, seed=0, schedule='random', threads=1):
+    # a fresh process per scenario, so peak memory isn't inherited from the previous one
+    context = multiprocessing.get_context('spawn')
+    scenarios = []
+    for citizens, mix, grid, vec in itertools.product(sizes, mixes, grids, vectorized):
+        name = f'{mix}-citizens{citizens}-grid{grid}' + ('-vectorized' if vec else '')
+        if schedule == 'staged':
+            name += f'-staged{threads}'
+        overrides = scenario_params(citizens, mix, grid, vec, warmup + steps, schedule, threads)
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_scenario, overrides, warmup, steps, seed).result()
+        scenarios.append({
+            'name': name, 'citizens': citizens, 'mix': mix, 'grid': grid, 'vectorized': vec,
+            'params': overrides, **result,
+            })
+        print(f"{name:50} {result['steps_per_second']:10.2f} steps/s {result['peak_rss_mb']:10.1f} MB")
+    return {'environment': environment(), 'scenarios': scenarios, 'scaling': scaling_exponents(scenarios)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark World.step over population sizes, type mixes and grid sizes.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[250, 500, 1000, 2000], help='numbers of citizens')
+    parser.add_argument('--mixes', nargs='+', default=['default'], choices=list(MIXES))
+    parser.add_argument('--grids', type=int, nargs='+', default=[10], help='grid width (and height)')
+    parser.add_argument('--vectorized', choices=['no', 'yes', 'both'], default='no', help='array-backed citizens and scientists')
+    parser.add_argument('--schedule', choices=['random', 'staged'], default='random')
+    parser.add_argument('--threads', type=int, default=1, help='threads for the citizen phase of the staged schedule')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed steps before timing')
+    parser.add_argument('--steps', type=int, default=3, help='timed steps')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='where to write the results (default ../output/benchmarks/<date>.json)')
+    parser.add_argument('--baseline', help='results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='slowdown that counts as a regression')
+    parser.add_argument('--agreement', action='store_true', help='check ScientistPopulation against BayesianScientist instead')
+    parser.add_argument('--agreement-seeds', type=int, default=30)
+    parser.add_argument('--agreement-steps', type=int, default=10)
+    parser.add_argument('--agreement-tolerance', type=float, default=4.0, help='standard errors apart that count as disagreeing')
+    args = parser.parse_args(argv)
+
+    if args.agreement:
+        rows, agree = scientist_agreement(args.agreement_seeds, args.agreement_steps, tolerance=args.agreement_tolerance)
+        for row in rows:
+            flag = '  DISAGREE' if row['z'] > args.agreement_tolerance else ''
+            print(f"step {row['step']:3} {row['statistic']:20} {row['reference']:10.4f} {row['vectorized']:10.4f} z {row['z']:5.2f}{flag}")
+        print('ScientistPopulation agrees with BayesianScientist' if agree else 'ScientistPopulation disagrees with BayesianScientist')
+        return 0 if agree else 1
+
+    vectorized = {'no': [False], 'yes': [True], 'both': [False, True]}[args.vectorized]
+    results = run_benchmarks(
+        args.sizes, args.mixes, args.grids, vectorized, args.warmup, args.steps, args.seed, args.schedule, args.threads
+        )
+
+    for row in results['scaling']:
+        exponents = ', '.join(f'{name} {b:.2f}' for name, b in row['exponents'].items())
+        print(f"scaling ({row['mix']}, grid {row['grid']}{', vectorized' if row['vectorized'] else ''}): {exponents}")
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        comparisons, regressions = compare(results, baseline, args.tolerance)
+        results['comparison'] = {'baseline': args.baseline, 'scenarios': comparisons, 'regressions': regressions}
+        for c in comparisons:
+            flag = '  REGRESSION' if c['name'] in regressions else ''
+            print(f"{c['name']:50} {c['ratio']:6.2f}x baseline step time{flag}")
+        status = 1 if regressions else 0
+
+    save = args.save or os.path.join(OUTPUT_DIR, 'benchmarks', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(save)), exist_ok=True)
+    with open(save, 'w') as file:
+        json.dump(results, file, indent=2)
+    print('Saved', save)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import os
+import gzip
+import pickle
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+from logsink import LogSink, NullSink
+from ensemble import LOG_DIR
+
+# Checkpoints
+# -----------
+# save_checkpoint() writes a World's whole state to one gzipped pickle: every agent (beliefs,
+# scientists' prior/posterior/discussed_belief, stories, exposure memory), the array-backed
+# populations, grid positions, the schedule and its step count, the data collected so far, and
+# the World's random streams (see rng.py), buffered draws included. load_checkpoint() puts it all
+# back, so a resumed run carries on exactly as if it had never stopped.
+#
+# fork() starts a new scenario from a checkpoint, with some parameters changed and optionally
+# a new seed, e.g. to run lots of interventions off one burned-in World (run_forks).
+#
+# The log sink isn't part of the checkpoint (it's open files and a thread). Like a new World, a
+# loaded one logs nowhere unless it's given a sink: pass one in when loading, e.g.
+# LogSink(directory, append=True) to carry on with the same logs.
+
+FORMAT_VERSION = 5
+# parameters that are baked into a World when it's built, so forks can't change them
+FIXED_AT_BUILD = (
+    'num_scientists', 'num_citizens', 'num_journalists', 'num_propagandists', 'num_policymakers',
+    'grid_width', 'grid_height', 'moore', 'include_center', 'vectorized_citizens', 'vectorized_scientists',
+    'topology', 'topology_degree', 'topology_rewiring', 'topology_exponent', 'topology_path',
+    'convergence', 'convergence_mean_shift', 'convergence_variance_shift', 'convergence_histogram_distance',
+    'convergence_patience', 'convergence_bins', 'aggregates', 'aggregate_bins', 'aggregate_thresholds',
+    'exposure_tracking', 'exposure_ring_size', 'exposure_sketch_bins', 'collect_every', 'collect_sample',
+    'scientist_beta_priors_alpha_low', 'scientist_beta_priors_alpha_high',
+    'scientist_beta_priors_beta_low', 'scientist_beta_priors_beta_high',
+    'scientist_study_sample_size_lower_bound', 'scientist_study_sample_size_upper_bound',
+    )
+
+
+def save_checkpoint(world, path, compresslevel=6):
+    """
+    Snapshot `world` to `path`.
+    """
+    # hand anything still buffered to the log writer, so the logs on disk match the checkpoint
+    if world.log is not None:
+        world.log.flush()
+    state = {
+        'version': FORMAT_VERSION,
+        'world': world,
+        }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + '.tmp'
+    with gzip.open(tmp, 'wb', compresslevel=compresslevel) as file:
+        pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return path
+
+
+def load_checkpoint(path, log_sink=None):
+    """
+    The World saved in `path`, logging to `log_sink` (default: nowhere, see above).
+    """
+    with gzip.open(path, 'rb') as file:
+        state = pickle.load(file)
+    if state.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Checkpoint {path} has format version {state.get('version')}, expected {FORMAT_VERSION}")
+    world = state['world']
+    world.log = log_sink if log_sink is not None else NullSink()
+    return world
+
+
+def fork(path, overrides=None, seed=None, log_sink=None):
+    """
+    A new World starting from the checkpoint in `path`, with `overrides` applied to its
+    parameters (anything read while stepping, e.g. thresholds and exposure risk). With a `seed`
+    the fork also gets fresh random streams, otherwise it continues the checkpoint's.
+    """
+    overrides = overrides or {}
+    fixed = [key for key in overrides if key in FIXED_AT_BUILD]
+    if fixed:
+        raise ValueError(f'Parameters fixed when the World was built can\'t be changed in a fork: {fixed}')
+    world = load_checkpoint(path, log_sink)
+    if overrides:
+        world.params = world.params.with_overrides(**overrides)
+    if seed is not None:
+        world.reseed(seed)
+    return world
+
+
+def run_fork(fork_id, path, overrides, seed, steps, log_dir=LOG_DIR, log_format='csv'):
+    """
+    Fork the checkpoint, run it `steps` more steps and return (fork_id, agent-step DataFrame).
+    The DataFrame includes the steps before the checkpoint.
+    """
+    log_sink = LogSink(os.path.join(log_dir, f'fork_{fork_id}'), format=log_format)
+    try:
+        world = fork(path, overrides, seed, log_sink)
+        for _ in range(steps):
+            world.step()
+            if not world.running:
+                break
+    finally:
+        log_sink.close()
+    agent_beliefs = world.get_agent_vars_dataframe().reset_index()
+    agent_beliefs['ForkID'] = fork_id
+    return fork_id, agent_beliefs
+
+
+def run_forks(path, variants, steps, seeds=None, workers=1, log_dir=LOG_DIR, log_format='csv'):
+    """
+    Run one fork per variant (a list of override dicts), in parallel, yielding
+    (fork_id, agent_beliefs) in order. `seeds` gives each fork its own seed (default: all of them
+    continue the checkpoint's random streams, common random numbers across the variants).
+    """
+    seeds = seeds if seeds is not None else [None] * len(variants)
+    fork_ids = range(len(variants))
+    if workers == 1:
+        for fork_id, overrides, seed in zip(fork_ids, variants, seeds):
+            yield run_fork(fork_id, path, overrides, seed, steps, log_dir, log_format)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(
+            run_fork, fork_ids, repeat(path), variants, seeds, repeat(steps), repeat(log_dir), repeat(log_format)
+            )
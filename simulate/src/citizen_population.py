@@ -0,0 +1,240 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# most discussion partners a citizen will talk to in one step (see Citizen.interaction)
+MAX_DISCUSSION_PARTNERS = 9
+
+
+def sample_without_replacement(counts, k, rng):
+    """
+    For each row i, draw k[i] distinct positions from range(counts[i]), with `rng` (a
+    rng.RandomStream). Returns an array of shape (len(counts), k.max()) with -1 in the unused
+    slots. Uses the classic "shift past the earlier picks" trick, so each round is a handful of
+    vectorized ops over the whole population.
+    """
+    if np.any(k > counts):
+        raise ValueError('Sample larger than population')
+    n = len(counts)
+    width = int(k.max()) if n else 0
+    picks = np.full((n, width), -1, dtype=np.int64)
+    for r in range(width):
+        active = k > r
+        u = np.floor(rng.random(n) * (counts - r)).astype(np.int64)
+        # walk the earlier picks in ascending order, stepping over each one we land on or after
+        earlier = np.sort(picks[:, :r], axis=1)
+        for c in range(r):
+            u += (u >= earlier[:, c])
+        picks[active, r] = u[active]
+    return picks
+
+
+class CitizenPopulation:
+    """
+    Every citizen in the model, held as NumPy arrays instead of one Agent object per person.
+    Runs the same four phases as Citizen.step (move, interaction, consumes_news_media,
+    encounters_propaganda), but each phase is a batched operation over the whole population.
+    Full beliefs_encountered histories don't fit at 10^6 agents, so the population only tracks
+    exposure with the bounded summaries from exposure.py (and not at all in 'full' mode).
+    """
+    agent_type = 'Citizen'
+
+    def __init__(self, num_citizens, model):
+        self.model = model
+        self.rng = model.rng['Citizen']
+        self.n = num_citizens
+        self.unique_id = np.arange(num_citizens, dtype=np.int64) + 40_000_000
+
+        # BELIEF VARIABLES (NaN where the per-object path would have None)
+        self.belief = self.rng.uniform(0, 1, num_citizens) # population heterogeneity
+        self.belief_after_talk = np.full(num_citizens, np.nan)
+        self.belief_after_talk_media = np.full(num_citizens, np.nan)
+        self.belief_after_talk_media_propaganda = np.full(num_citizens, np.nan)
+
+        # POSITIONS ON THE (TORUS) GRID, see space.CellGrid
+        self.grid = model.grid
+        self.x, self.y = self.grid.random_positions(num_citizens, self.rng)
+
+        # EXPOSURE SUMMARIES (None when the model tracks full histories)
+        self.exposure = model.exposure.new_arrays(num_citizens)
+
+
+    def log_interactions(self, stream, i, j, step):
+        ij_belief_difference = self.belief[i] - self.belief[j]
+        update = np.abs(ij_belief_difference) < self.model.params['citizen_difference_threshold']
+        self.model.log.write_columns(stream, (
+            self.unique_id[i], self.unique_id[j], ij_belief_difference, update, np.full(len(i), step)
+            ))
+
+    def log_movements(self, stream, step):
+        self.model.log.write_columns(stream, (self.unique_id, self.x, self.y, np.full(self.n, step)))
+
+    def move(self, step):
+        self.x, self.y = self.grid.move_all(self.x, self.y, self.rng)
+        self.log_movements('travel_citizens', step)
+
+    def draw_partners(self, peers):
+        """
+        Select N discussion partners for everyone, 1 to 9 of them, never more than there are peers.
+        Returns each citizen's picks (positions among their cell's citizens, -1 for unused slots).
+        """
+        k = np.zeros(self.n, dtype=np.int64)
+        talkers = peers > 1
+        k[talkers] = np.floor(
+            1 + self.rng.random(talkers.sum()) * (np.minimum(peers[talkers], MAX_DISCUSSION_PARTNERS + 1) - 1)
+            ).astype(np.int64)
+        return sample_without_replacement(peers, k, self.rng)
+
+    def interaction(self, step):
+        # everyone's peer group (cellmates or network neighbours), see topology.py
+        peers, member = self.model.topology.peer_groups(self) # peers includes self, same as the per-object path
+        picks = self.draw_partners(peers)
+
+        # the interaction, one partner per round for everyone at once
+        threshold = self.model.params['citizen_difference_threshold']
+        for r in range(picks.shape[1]):
+            i = np.flatnonzero(picks[:, r] >= 0)
+            j = member(i, picks[i, r])
+            partner_belief = self.belief[j]
+            # log the encountered belief
+            if self.exposure is not None:
+                self.exposure.add(i, partner_belief)
+            update = np.abs(self.belief[i] - partner_belief) < threshold
+            self.belief_after_talk[i] = np.where(
+                update, np.trunc((self.belief[i] + partner_belief) / 2), self.belief[i]
+                )
+            self.belief[i] = self.belief_after_talk[i]
+            # log the interaction metadata, ignoring self loops
+            not_self = i != j
+            self.log_interactions('interactions_citizens', i[not_self], j[not_self], step)
+
+    def draw_reading(self, count, num_stories):
+        """
+        What `count` citizens read out of `num_stories` stories: (k, picks), each reading k[i]
+        distinct stories. Without exposure tracking only the last story matters, so that's
+        (None, last story) instead.
+        """
+        if self.exposure is None:
+            # no need to draw the whole reading list, the last story is a uniform draw
+            return None, self.rng.integers(0, num_stories, count)
+        k = self.rng.integers(2, 10, count)
+        return k, sample_without_replacement(np.full(count, num_stories), k, self.rng)
+
+    def apply_reading(self, i, stories, k, picks):
+        """
+        Citizens i read what draw_reading picked for them, returns the last story each of them read.
+        """
+        if k is None:
+            return stories[picks]
+        for r in range(picks.shape[1]):
+            read = np.flatnonzero(picks[:, r] >= 0)
+            self.exposure.add(i[read], stories[picks[read, r]])
+        return stories[picks[np.arange(len(i)), k - 1]]
+
+    def read(self, i, stories):
+        """
+        Each citizen in i reads 2 to 9 distinct stories, returns the last one each of them read
+        (the only one that moves their belief).
+        """
+        return self.apply_reading(i, stories, *self.draw_reading(len(i), len(stories)))
+
+    def consumes_news_media(self):
+        journalists = self.model.stories('Journalist')
+        # the agent will read anywhere between 2 and 10 news stories by journalists
+        s = self.read(np.arange(self.n), journalists)
+        base = np.where(np.isnan(self.belief_after_talk), self.belief, self.belief_after_talk)
+        self.belief_after_talk_media = (0.6 * base + 0.3 * s) / 0.9
+        self.belief = self.belief_after_talk_media.copy()
+
+    def encounters_propaganda(self):
+        exposed = np.flatnonzero(self.rng.random(self.n) < .8)
+        propagandists = self.model.stories('Propagandist')
+        # the agent will read anywhere between 2 and 10 pieces of bullshit
+        s = self.read(exposed, propagandists)
+        self.belief_after_talk_media_propaganda[exposed] = (0.6 * self.belief_after_talk_media[exposed] + 0.3 * s) / 0.9
+        self.belief[exposed] = self.belief_after_talk_media[exposed]
+
+    def step(self, step):
+        self.move(step)
+        self.interaction(step)
+        self.consumes_news_media()
+        self.encounters_propaganda()
+
+    def staged_step(self, step, snapshot, threads=1):
+        """
+        The citizens' part of the staged schedule (see World.staged_step): everyone moves, then
+        talks, reads the news and meets propaganda from the frozen `snapshot`. All the random draws
+        happen up front, and partners' beliefs are read as they were when the phase started, so
+        the chunks of citizens are independent and update in `threads` threads. The result is the
+        same for any number of threads.
+        """
+        self.move(step)
+        peers, member = self.model.topology.peer_groups(self)
+        picks = self.draw_partners(peers)
+        partners = np.where(picks >= 0, member(np.arange(self.n)[:, None], np.maximum(picks, 0)), -1)
+        news = self.draw_reading(self.n, len(snapshot.stories('Journalist')))
+        exposed = self.rng.random(self.n) < .8
+        propaganda = self.draw_reading(self.n, len(snapshot.stories('Propagandist')))
+        frozen = self.belief.copy()
+
+        bounds = np.linspace(0, self.n, min(threads, max(self.n, 1)) + 1).astype(np.int64)
+        chunks = [(lo, hi, frozen, partners, news, exposed, propaganda, snapshot) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        if len(chunks) == 1:
+            logs = [self._update_chunk(*chunks[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+                logs = list(executor.map(lambda chunk: self._update_chunk(*chunk), chunks))
+        # the log sink isn't thread safe, write the interactions once everyone's done, round by
+        # round so the rows come out in the same order however many chunks there were
+        for r in range(partners.shape[1]):
+            columns = [np.concatenate(column) for column in zip(*(chunk[r] for chunk in logs))]
+            self.model.log.write_columns('interactions_citizens', (*columns, np.full(len(columns[0]), step)))
+
+    def _update_chunk(self, lo, hi, frozen, partners, news, exposed, propaganda, snapshot):
+        """
+        Update citizens lo:hi, the rows of every array that only this chunk writes to. Returns
+        their interactions as log columns.
+        """
+        threshold = self.model.params['citizen_difference_threshold']
+        rows = np.arange(lo, hi)
+        logs = []
+        for r in range(partners.shape[1]):
+            i = rows[partners[lo:hi, r] >= 0]
+            j = partners[i, r]
+            partner_belief = frozen[j]
+            if self.exposure is not None:
+                self.exposure.add(i, partner_belief)
+            update = np.abs(self.belief[i] - partner_belief) < threshold
+            self.belief_after_talk[i] = np.where(
+                update, np.trunc((self.belief[i] + partner_belief) / 2), self.belief[i]
+                )
+            self.belief[i] = self.belief_after_talk[i]
+            not_self = i != j
+            i, j = i[not_self], j[not_self]
+            difference = self.belief[i] - frozen[j]
+            logs.append((self.unique_id[i], self.unique_id[j], difference, np.abs(difference) < threshold))
+
+        k, picks = news
+        s = self.apply_reading(rows, snapshot.stories('Journalist'), None if k is None else k[lo:hi], picks[lo:hi])
+        base = np.where(np.isnan(self.belief_after_talk[lo:hi]), self.belief[lo:hi], self.belief_after_talk[lo:hi])
+        self.belief_after_talk_media[lo:hi] = (0.6 * base + 0.3 * s) / 0.9
+        self.belief[lo:hi] = self.belief_after_talk_media[lo:hi]
+
+        i = rows[exposed[lo:hi]]
+        k, picks = propaganda
+        s = self.apply_reading(i, snapshot.stories('Propagandist'), None if k is None else k[i], picks[i])
+        self.belief_after_talk_media_propaganda[i] = (0.6 * self.belief_after_talk_media[i] + 0.3 * s) / 0.9
+        self.belief[i] = self.belief_after_talk_media[i]
+        return logs
+
+    def columns(self):
+        """
+        Current values for the collector, keyed by column name.
+        """
+        return {
+            'Belief (After All Step Actions)': self.belief,
+            'Belief After Talk': self.belief_after_talk,
+            'Belief After Talk Media': self.belief_after_talk_media,
+            'Belief After Talk Media Propaganda': self.belief_after_talk_media_propaganda,
+            **(self.exposure.summary() if self.exposure is not None else {})
+            }
@@ -1,95 +1,75 @@
-import yaml
-import random 
 import numpy as np
-from mesa import Agent
-from scipy import stats
+from registry import IndexedAgent, Tracked
 
-# LOAD MODEL PARAMETERS
-with open(r'../input/parameters.yaml') as params:
-    params = yaml.load(params, Loader=yaml.FullLoader)
 
-class Citizen(Agent):
+class Citizen(IndexedAgent):
     """
     Simulated citizen trying to figure out what the hell is going on...
     """
+    __slots__ = ('_belief_after_talk', '_belief_after_talk_media', '_belief_after_talk_media_propaganda', 'beliefs_encountered')
+    agent_type = 'Citizen'
+    belief_after_talk = Tracked()
+    belief_after_talk_media = Tracked()
+    belief_after_talk_media_propaganda = Tracked()
+
     def __init__(self, unique_id, model):
         super().__init__(unique_id+40_000_000, model)
-        self.agent_type = 'Citizen'
         
         # BELIEF VARIABLES
-        self.belief = float(np.random.uniform(0, 1, 1)) # population heterogeneity
+        self.belief = self.rng.uniform(0, 1) # population heterogeneity
         self.belief_after_talk = None
         self.belief_after_talk_media = None
         self.belief_after_talk_media_propaganda = None 
-        self.beliefs_encountered = []
-
-        # SATISFY THE DATA COLLECTOR 
-        self.prior = None # scientists only
-        self.prior_mean = None # scientists only
-        self.posterior = None # scientists only
-        self.posterior_mean = None # scientists only
-        self.story = None # journalists and propagandists only
+        self.beliefs_encountered = model.exposure.new_tracker() # see exposure.py
 
-    def log_interaction(self, filename, alter, agent_threshold):
-        with open(filename, 'a') as file:
-            if self.unique_id == alter.unique_id:
-                pass # ignore self loops entirely
+    def log_interaction(self, stream, alter, agent_threshold):
+        if self.unique_id == alter.unique_id:
+            pass # ignore self loops entirely
+        else:
+            if abs(self.belief - alter.belief) < agent_threshold:
+                update = True 
             else:
-                if abs(self.belief - alter.belief) < agent_threshold:
-                    update = True 
-                else:
-                    update = False
-                ij_belief_difference = self.belief - alter.belief 
-                s = f'{self.unique_id},{alter.unique_id},{ij_belief_difference},{update},{self.model.schedule.steps}\n'
-                file.write(s)
+                update = False
+            ij_belief_difference = self.belief - alter.belief 
+            self.model.log.write(stream, (self.unique_id, alter.unique_id, ij_belief_difference, update, self.model.schedule.steps))
 
-    def log_movements(self, filename):
-        with open(filename, 'a') as file:
-            s = f'{self.unique_id},{self.pos[0]},{self.pos[1]},{self.model.schedule.steps}\n'
-            file.write(s)
+    def log_movements(self, stream):
+        self.model.log.write(stream, (self.unique_id, self.pos[0], self.pos[1], self.model.schedule.steps))
 
     def move(self):
-        possible_steps = self.model.grid.get_neighborhood(
-            self.pos,
-            moore=params['moore'],
-            include_center = params['include_center'])
-        new_position = self.random.choice(possible_steps)
+        new_position = self.model.grid.random_neighbour(self.pos, self.rng)
         self.model.grid.move_agent(self, new_position)
-        self.log_movements('../output/travel_citizens.csv')
+        self.log_movements('travel_citizens')
     
     def interaction(self):
-        cellmates = self.model.grid.get_cell_list_contents([self.pos])
-        peers = []
-        if len(cellmates) > 1:
-            for c in cellmates:
-                if c.agent_type == 'Citizen':
-                    peers.append(c)
-            # select N discussion partners
-            if len(peers) > 1: 
-                if len(peers) < 10:
-                    num_discussion_partners = int(np.random.randint(1,len(peers),1)) 
-                else: # don't let them talk to 500 people in one step... 
-                    num_discussion_partners = int(np.random.randint(1,10,1)) 
-                discussion_partners = random.sample(peers, num_discussion_partners)
-                # the interaction
-                for partner in discussion_partners:
-                    # log the encountered belief
-                    self.beliefs_encountered.append(partner.belief)
-                    # update beliefs or not
-                    if abs(self.belief - partner.belief) < params['citizen_difference_threshold']:
-                        self.belief_after_talk = int(np.mean([self.belief, partner.belief]))
-                        self.belief = self.belief_after_talk
-                    else:
-                        self.belief_after_talk = self.belief
-                    # log the interaction metadata
-                    self.log_interaction(filename='../output/interactions_citizens.csv', alter=partner, agent_threshold=params['citizen_difference_threshold'])
+        # the other citizens in this cell (or network neighbourhood) and self, see topology.py
+        peers = self.model.topology.peers(self)
+        # select N discussion partners
+        if len(peers) > 1: 
+            if len(peers) < 10:
+                num_discussion_partners = self.rng.integers(1, len(peers))
+            else: # don't let them talk to 500 people in one step... 
+                num_discussion_partners = self.rng.integers(1, 10)
+            discussion_partners = self.rng.sample(peers, num_discussion_partners)
+            # the interaction
+            for partner in discussion_partners:
+                # log the encountered belief
+                self.beliefs_encountered.append(partner.belief)
+                # update beliefs or not
+                if abs(self.belief - partner.belief) < self.model.params['citizen_difference_threshold']:
+                    self.belief_after_talk = int(np.mean([self.belief, partner.belief]))
+                    self.belief = self.belief_after_talk
+                else:
+                    self.belief_after_talk = self.belief
+                # log the interaction metadata
+                self.log_interaction(stream='interactions_citizens', alter=partner, agent_threshold=self.model.params['citizen_difference_threshold'])
 
     def consumes_news_media(self):
-        journalists = [j.story for j in self.model.schedule.agents if j.agent_type == 'Journalist']
+        journalists = self.model.stories('Journalist')
         # the agent will read anywhere between 2 and 10 news stories by journalists
-        number_of_stories_to_read = int(np.random.randint(2, 10, 1)) 
+        number_of_stories_to_read = self.rng.integers(2, 10)
         # sample stories to read
-        stories = random.sample(journalists, number_of_stories_to_read)
+        stories = journalists[self.rng.sample(range(len(journalists)), number_of_stories_to_read)].tolist()
         # log the encountered belief
         for s in stories: # 'stories' are just floats representing the 'belief' the story presents
             self.beliefs_encountered.append(s)
@@ -103,13 +83,12 @@ class Citizen(Agent):
         
     def encounters_propaganda(self):
         # do they get exposed to propaganda?
-        exposure = int(stats.bernoulli(.8).rvs(1))
-        if exposure == 1: # otherwise, escape unscathed
-            propagandists = [p.story for p in self.model.schedule.agents if p.agent_type == 'Propagandist']
+        if self.rng.bernoulli(.8): # otherwise, escape unscathed
+            propagandists = self.model.stories('Propagandist')
             # the agent will read anywhere between 2 and 10 pieces of bullshit
-            amount_of_bullshit_to_read =  int(np.random.randint(2, 10, 1)) 
+            amount_of_bullshit_to_read = self.rng.integers(2, 10)
             # sample bullshit to read
-            stories = random.sample(propagandists, amount_of_bullshit_to_read)
+            stories = propagandists[self.rng.sample(range(len(propagandists)), amount_of_bullshit_to_read)].tolist()
             for s in stories:
                 self.beliefs_encountered.append(s)
                 self.belief_after_talk_media_propaganda = np.average([self.belief_after_talk_media, s], weights=[0.6, 0.3])
@@ -0,0 +1,169 @@
+import numpy as np
+import pandas as pd
+
+from registry import TRACKED
+
+# column order in the combined frame (the order mesa's DataCollector used to give us)
+COLUMN_ORDER = [
+    'Prior', 'Prior Mean', 'Posterior', 'Posterior Mean', 'Story',
+    'Belief (After All Step Actions)', 'Belief After Talk', 'Belief After Talk Media',
+    'Belief After Talk Media Propaganda',
+    ]
+
+
+class _TypeColumns:
+    """
+    Everything collected for one agent type, in growable preallocated NumPy columns.
+    """
+    def __init__(self, capacity):
+        self.capacity = max(capacity, 1)
+        self.size = 0
+        self.step = np.empty(self.capacity, dtype=np.int64)
+        self.agent_id = np.empty(self.capacity, dtype=np.int64)
+        self.columns = {}
+
+    def _reserve(self, rows):
+        if self.size + rows <= self.capacity:
+            return
+        while self.capacity < self.size + rows:
+            self.capacity *= 2
+        self.step = np.resize(self.step, self.capacity)
+        self.agent_id = np.resize(self.agent_id, self.capacity)
+        for name, column in self.columns.items():
+            self.columns[name] = np.resize(column, self.capacity)
+
+    def append(self, step, agent_id, values):
+        rows = len(agent_id)
+        self._reserve(rows)
+        start, stop = self.size, self.size + rows
+        self.step[start:stop] = step
+        self.agent_id[start:stop] = agent_id
+        for name, column in values.items():
+            if name not in self.columns:
+                # numbers go in float columns (None -> NaN), anything else (lists) in object columns
+                dtype = float if column.dtype != object else object
+                self.columns[name] = np.empty(self.capacity, dtype=dtype)
+                if dtype is object:
+                    self.columns[name][:start] = None
+                else:
+                    self.columns[name][:start] = np.nan
+            self.columns[name][start:stop] = column
+        self.size = stop
+
+    def frame(self, agent_type):
+        df = pd.DataFrame({
+            'Step': self.step[:self.size],
+            'AgentID': self.agent_id[:self.size],
+            'Agent Type': agent_type,
+            **{name: column[:self.size] for name, column in self.columns.items()}
+            })
+        return df
+
+
+def _as_column(values):
+    """
+    Reported values as a float array (None -> NaN), or an object array if they aren't plain
+    numbers (e.g. the [alpha, beta] lists scientists report).
+    """
+    if isinstance(values, np.ndarray):
+        return values
+    if any(isinstance(v, (list, tuple, np.ndarray)) for v in values):
+        column = np.empty(len(values), dtype=object)
+        column[:] = values
+        return column
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+class TypedCollector:
+    """
+    Collects agent data per agent type, with only the reporters that make sense for that type.
+
+    `reporters` maps agent type -> {column name: reporter}. A reporter is an attribute name or a
+    callable taking one agent. Attributes the registry tracks (see registry.TRACKED) are
+    read straight from its arrays, and array-backed populations report through their `columns()`
+    method, so neither needs a per-agent getattr.
+
+    Collects every `every` steps. With `sample` (a fraction, or a number of agents per type) only a
+    random subsample of each type is collected, the same agents every time. `expected_steps`
+    sizes the columns up front so they never need to grow.
+    """
+    def __init__(self, reporters, every=1, sample=None, expected_steps=None, seed=None):
+        self.reporters = reporters
+        self.every = every
+        self.sample = sample
+        self.expected_steps = expected_steps
+        self.rng = np.random.default_rng(seed)
+        self.rows = {} # agent type -> sampled row indexes (None = everyone)
+        self.data = {}
+
+    def _sampled_rows(self, agent_type, count):
+        if agent_type not in self.rows:
+            rows = None
+            if self.sample is not None:
+                size = int(round(self.sample * count)) if isinstance(self.sample, float) else int(self.sample)
+                if size < count:
+                    rows = np.sort(self.rng.choice(count, size, replace=False))
+            self.rows[agent_type] = rows
+        return self.rows[agent_type]
+
+    def _table(self, agent_type, rows):
+        if agent_type not in self.data:
+            collections = -(-self.expected_steps // self.every) if self.expected_steps else 16
+            self.data[agent_type] = _TypeColumns(collections * rows)
+        return self.data[agent_type]
+
+    def collect(self, model, step):
+        if step % self.every:
+            return
+        registry = model.registry
+        for agent_type, reporters in self.reporters.items():
+            count = registry.count(agent_type)
+            if count == 0:
+                continue
+            rows = self._sampled_rows(agent_type, count)
+            agent_id = registry.unique_ids(agent_type)
+            if agent_type in registry.populations:
+                columns = registry.populations[agent_type].columns()
+                values = {name: _as_column(columns[name]) for name in reporters if name in columns}
+                if rows is not None:
+                    values = {name: column[rows] for name, column in values.items()}
+            else:
+                agents = registry.agents(agent_type)
+                if rows is not None:
+                    agents = [agents[r] for r in rows]
+                values = {}
+                for name, reporter in reporters.items():
+                    if callable(reporter):
+                        values[name] = _as_column([reporter(a) for a in agents])
+                    elif reporter in TRACKED:
+                        # already a contiguous array in the registry
+                        column = registry.values(agent_type, reporter)
+                        values[name] = column if rows is None else column[rows]
+                    else:
+                        values[name] = _as_column([getattr(a, reporter) for a in agents])
+            if rows is not None:
+                agent_id = agent_id[rows]
+            self._table(agent_type, len(agent_id)).append(step, agent_id, values)
+
+    def get_type_frame(self, agent_type):
+        """
+        Everything collected for one agent type, one row per agent per collected step.
+        """
+        return self.data[agent_type].frame(agent_type)
+
+    def get_agent_vars_dataframe(self):
+        """
+        All types in one long frame indexed by (Step, AgentID), like mesa's DataCollector. Columns
+        a type has no reporter for are NaN.
+        """
+        frames = [self.get_type_frame(agent_type) for agent_type in self.data]
+        if not frames:
+            return pd.DataFrame()
+        columns = ['Step', 'AgentID', 'Agent Type']
+        for name in COLUMN_ORDER:
+            if any(name in reporters for reporters in self.reporters.values()):
+                columns.append(name)
+        for reporters in self.reporters.values():
+            columns += [name for name in reporters if name not in columns]
+        df = pd.concat(frames, ignore_index=True).reindex(columns=columns)
+        return df.sort_values('Step', kind='stable').set_index(['Step', 'AgentID'])
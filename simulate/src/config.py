@@ -0,0 +1,254 @@
+import os
+import pickle
+import hashlib
+from collections.abc import Mapping
+
+import yaml
+try:
+    from yaml import CSafeLoader as Loader # libyaml, much faster when it's installed
+except ImportError:
+    from yaml import SafeLoader as Loader
+
+from exposure import FIELDS
+from topology import TOPOLOGIES
+
+# Model configuration
+# -------------------
+# parameters.yaml is parsed once per process, validated, and handed to World (and from there to
+# the agents, as model.params) as one Config object. Nothing else opens the file.
+#
+# The parsed values are also cached as a pickle in __pycache__, keyed by the yaml file's size and
+# modification time, so worker processes and repeated runs skip the YAML parse. Drivers that
+# build lots of Worlds (sweeps, ensembles) should use config.with_overrides(...) instead of
+# writing yaml files.
+#
+# Paths are relative to this file, not the working directory, so everything runs from anywhere.
+
+SIMULATE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INPUT_DIR = os.path.join(SIMULATE_DIR, 'input')
+OUTPUT_DIR = os.path.join(SIMULATE_DIR, 'output')
+PARAMETERS_PATH = os.path.join(INPUT_DIR, 'parameters.yaml')
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__')
+
+COUNTS = (
+    'num_scientists', 'num_citizens', 'num_journalists', 'num_propagandists', 'num_policymakers',
+    'number_of_simulations', 'steps_per_model',
+    )
+FLAGS = ('moore', 'include_center')
+THRESHOLDS = ('citizen_difference_threshold', 'policymaker_difference_threshold', 'scientist_difference_threshold')
+PROBABILITIES = ('scientist_research_bernoulli_probability', 'journalist_risk_of_exposure_to_propaganda')
+BOUNDS = (
+    ('scientist_beta_priors_alpha_low', 'scientist_beta_priors_alpha_high'),
+    ('scientist_beta_priors_beta_low', 'scientist_beta_priors_beta_high'),
+    ('scientist_study_sample_size_lower_bound', 'scientist_study_sample_size_upper_bound'),
+    )
+REQUIRED = COUNTS + FLAGS + THRESHOLDS + PROBABILITIES + tuple(key for pair in BOUNDS for key in pair)
+
+# optional parameters and what you get without them
+DEFAULTS = {
+    'grid_width': 10,
+    'grid_height': 10,
+    'vectorized_citizens': False,
+    'vectorized_scientists': False,
+    'exposure_tracking': 'full',
+    'exposure_ring_size': 20,
+    'exposure_sketch_bins': 20,
+    'collect_every': 1,
+    'collect_sample': None,
+    'log_format': 'csv',
+    'model_runs_csv': True,
+    'profile': False,
+    'schedule': 'random',
+    'threads': 1,
+    'rng_block': 4096,
+    'topology': 'grid',
+    'topology_degree': 10,
+    'topology_rewiring': 0.1,
+    'topology_exponent': 2.5,
+    'topology_path': None,
+    'convergence': False,
+    'convergence_mean_shift': 0.001,
+    'convergence_variance_shift': 0.0005,
+    'convergence_histogram_distance': 0.02,
+    'convergence_patience': 5,
+    'convergence_bins': 20,
+    'ensemble': 'fixed',
+    'adaptive_outcomes': ['final_mean_citizen_belief', 'policymakers_above_half'],
+    'adaptive_target_width': 0.05,
+    'adaptive_confidence': 0.95,
+    'adaptive_batch': None,
+    'adaptive_min_simulations': 5,
+    'adaptive_max_simulations': 200,
+    'collect_agents': True,
+    'aggregates': False,
+    'aggregate_bins': 50,
+    'aggregate_thresholds': [0.5],
+    'trajectory': False,
+    'trajectory_dtype': 'float32',
+    'workers': 1,
+    'chunksize': 1,
+    'seed': None,
+    }
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_count(value):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def validate(values):
+    """
+    Every problem with a set of parameters, as a list of messages (empty if they're fine).
+    """
+    problems = [f'missing parameter: {key}' for key in REQUIRED if key not in values]
+    for key in COUNTS:
+        if key in values and not _is_count(values[key]):
+            problems.append(f'{key} should be a non-negative integer, got {values[key]!r}')
+    for key in FLAGS + ('vectorized_citizens', 'vectorized_scientists', 'model_runs_csv', 'profile', 'trajectory', 'convergence', 'collect_agents', 'aggregates'):
+        if key in values and not isinstance(values[key], bool):
+            problems.append(f'{key} should be true or false, got {values[key]!r}')
+    for key in THRESHOLDS:
+        if key in values and not (_is_number(values[key]) and values[key] >= 0):
+            problems.append(f'{key} should be a non-negative number, got {values[key]!r}')
+    for key in ('convergence_mean_shift', 'convergence_variance_shift'):
+        if key in values and not (_is_number(values[key]) and values[key] >= 0):
+            problems.append(f'{key} should be a non-negative number, got {values[key]!r}')
+    for key in PROBABILITIES + ('topology_rewiring', 'convergence_histogram_distance'):
+        if key in values and not (_is_number(values[key]) and 0 <= values[key] <= 1):
+            problems.append(f'{key} should be a probability, got {values[key]!r}')
+    for low, high in BOUNDS:
+        if low in values and high in values:
+            if not (_is_number(values[low]) and _is_number(values[high]) and 0 < values[low] <= values[high]):
+                problems.append(f'{low} and {high} should be positive numbers with {low} <= {high}')
+    for key in ('grid_width', 'grid_height', 'exposure_ring_size', 'exposure_sketch_bins', 'collect_every', 'threads', 'rng_block', 'topology_degree', 'convergence_patience', 'convergence_bins', 'adaptive_min_simulations', 'adaptive_max_simulations', 'aggregate_bins', 'workers', 'chunksize'):
+        if key in values and not (_is_count(values[key]) and values[key] >= 1):
+            problems.append(f'{key} should be a positive integer, got {values[key]!r}')
+    sample = values.get('collect_sample')
+    if sample is not None and not ((_is_count(sample) and sample >= 1) or (isinstance(sample, float) and 0 < sample <= 1)):
+        problems.append(f'collect_sample should be a positive integer (agents) or a share in (0, 1], got {sample!r}')
+    if values.get('exposure_tracking', 'full') not in FIELDS:
+        problems.append(f"exposure_tracking should be one of {list(FIELDS)}, got {values['exposure_tracking']!r}")
+    topology = values.get('topology', 'grid')
+    if topology not in TOPOLOGIES:
+        problems.append(f'topology should be one of {list(TOPOLOGIES)}, got {topology!r}')
+    if not (_is_number(values.get('topology_exponent', 2.5)) and values.get('topology_exponent', 2.5) > 2):
+        problems.append(f"topology_exponent should be a number above 2, got {values['topology_exponent']!r}")
+    if topology == 'file' and not isinstance(values.get('topology_path'), str):
+        problems.append('topology: file needs topology_path, the network directory to load')
+    thresholds = values.get('aggregate_thresholds', [0.5])
+    if not (isinstance(thresholds, list) and all(_is_number(t) and 0 <= t <= 1 for t in thresholds)):
+        problems.append(f'aggregate_thresholds should be a list of numbers in [0, 1], got {thresholds!r}')
+    if values.get('collect_agents') is False and values.get('ensemble') == 'adaptive':
+        problems.append('ensemble: adaptive reads its outcomes from the collected agents, it needs collect_agents: true')
+    if values.get('ensemble', 'fixed') not in ('fixed', 'adaptive'):
+        problems.append(f"ensemble should be 'fixed' or 'adaptive', got {values['ensemble']!r}")
+    if values.get('ensemble') == 'adaptive':
+        outcomes = values.get('adaptive_outcomes')
+        if not (isinstance(outcomes, list) and outcomes and all(isinstance(name, str) for name in outcomes)):
+            problems.append(f'adaptive_outcomes should be a list of outcome names, got {outcomes!r}')
+        target = values.get('adaptive_target_width')
+        widths = list(target.values()) if isinstance(target, dict) else [target]
+        if not all(_is_number(width) and width > 0 for width in widths):
+            problems.append(f'adaptive_target_width should be a positive number (or outcome: number), got {target!r}')
+        if not (_is_number(values.get('adaptive_confidence')) and 0 < values['adaptive_confidence'] < 1):
+            problems.append(f"adaptive_confidence should be between 0 and 1, got {values.get('adaptive_confidence')!r}")
+        batch = values.get('adaptive_batch')
+        if batch is not None and not (_is_count(batch) and batch >= 1):
+            problems.append(f'adaptive_batch should be a positive integer, got {batch!r}')
+        if _is_count(values.get('adaptive_min_simulations')) and _is_count(values.get('adaptive_max_simulations')):
+            if values['adaptive_min_simulations'] > values['adaptive_max_simulations']:
+                problems.append('adaptive_min_simulations should be at most adaptive_max_simulations')
+    if values.get('trajectory_dtype', 'float32') not in ('float32', 'float64'):
+        problems.append(f"trajectory_dtype should be 'float32' or 'float64', got {values['trajectory_dtype']!r}")
+    if values.get('schedule', 'random') not in ('random', 'staged'):
+        problems.append(f"schedule should be 'random' or 'staged', got {values['schedule']!r}")
+    if values.get('log_format', 'csv') not in ('csv', 'columnar'):
+        problems.append(f"log_format should be 'csv' or 'columnar', got {values['log_format']!r}")
+    return problems
+
+
+class Config(Mapping):
+    """
+    Validated, read-only model parameters. Reads like the dict we used to get from yaml
+    (params['num_citizens'], params.get(...)), with DEFAULTS filled in for the optional keys.
+    Cheap to pickle, so it's what gets sent to worker processes.
+    """
+    def __init__(self, values):
+        values = {**DEFAULTS, **values}
+        problems = validate(values)
+        if problems:
+            raise ValueError('Invalid model parameters:\n  ' + '\n  '.join(problems))
+        self._values = values
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return f'Config({self._values!r})'
+
+    def __reduce__(self):
+        return Config, (self._values,)
+
+    def with_overrides(self, **overrides):
+        """
+        A new Config with some values replaced, no file access.
+        """
+        return Config({**self._values, **overrides})
+
+
+def _cache_path(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    digest = hashlib.md5(os.path.abspath(path).encode()).hexdigest()[:8]
+    return os.path.join(CACHE_DIR, f'{name}.{digest}.pickle')
+
+
+def _read_values(path):
+    """
+    The raw values in a yaml file, from the pickle cache if it's still fresh.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    cache = _cache_path(path)
+    try:
+        with open(cache, 'rb') as f:
+            cached_key, values = pickle.load(f)
+        if cached_key == key:
+            return values
+    except (OSError, pickle.PickleError, EOFError, ValueError):
+        pass
+    with open(path) as f:
+        values = yaml.load(f, Loader=Loader) or {}
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = f'{cache}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump((key, values), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache)
+    except OSError:
+        pass # read-only checkout, just parse every time
+    return values
+
+
+_loaded = {}
+
+
+def load_config(path=PARAMETERS_PATH, **overrides):
+    """
+    The Config in `path` (../input/parameters.yaml by default), loaded once per process and
+    reused until the file changes. Keyword arguments override values from the file.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key not in _loaded:
+        _loaded[key] = Config(_read_values(path))
+    config = _loaded[key]
+    return config.with_overrides(**overrides) if overrides else config
@@ -0,0 +1,92 @@
+import numpy as np
+
+# Convergence
+# -----------
+# With `convergence: true` a World watches its belief distributions and stops itself once they've
+# settled, instead of always running `steps_per_model` steps. At the start of every step (the
+# state the collector sees) it takes a few cheap statistics of
+#
+#   Citizen, Policymaker   belief
+#   Scientist              posterior_mean
+#
+# (mean, variance and a `convergence_bins`-bin histogram over [0, 1]) and compares them with the
+# previous step's. The step is stable when, for every type, the mean moved by at most
+# `convergence_mean_shift`, the variance by at most `convergence_variance_shift`, and the
+# histograms are within `convergence_histogram_distance` of each other (total variation
+# distance, the share of agents that would have to change bins). After `convergence_patience`
+# stable steps in a row the World sets model.running = False (mesa's flag for "done") and the
+# driver stops stepping it.
+#
+# The step a run stopped at ends up in the results (see ensemble.run_replicate): Steps Run is how
+# many steps it ran, Converged whether it stopped early. Full-length runs have
+# Steps Run == steps_per_model and Converged False.
+
+WATCHED = (('Citizen', 'belief'), ('Policymaker', 'belief'), ('Scientist', 'posterior_mean'))
+
+
+def summarize(values, bins):
+    """
+    (mean, variance, histogram as shares) of one type's values, NaNs left out.
+    """
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    which = np.minimum((np.clip(values, 0, 1) * bins).astype(np.int64), bins - 1)
+    histogram = np.bincount(which, minlength=bins) / len(values)
+    return values.mean(), values.var(), histogram
+
+
+class ConvergenceMonitor:
+    """
+    Decides when a World's beliefs have stopped changing, see above. `stable` counts the stable
+    steps in a row so far, `stopped_at` is the step the World stopped at (None while running).
+    """
+    def __init__(self, mean_shift, variance_shift, histogram_distance, patience, bins=20):
+        self.mean_shift = mean_shift
+        self.variance_shift = variance_shift
+        self.histogram_distance = histogram_distance
+        self.patience = patience
+        self.bins = bins
+        self.previous = None
+        self.stable = 0
+        self.stopped_at = None
+
+    @classmethod
+    def from_params(cls, params):
+        return cls(
+            params['convergence_mean_shift'],
+            params['convergence_variance_shift'],
+            params['convergence_histogram_distance'],
+            params['convergence_patience'],
+            params['convergence_bins']
+            )
+
+    def observe(self, model, step):
+        """
+        Take this step's statistics. True once the beliefs have been stable long enough.
+        """
+        current = {}
+        for agent_type, name in WATCHED:
+            if model.registry.count(agent_type):
+                current[agent_type] = summarize(np.asarray(model.registry.values(agent_type, name), dtype=float), self.bins)
+        if self.previous is not None and self.settled(self.previous, current):
+            self.stable += 1
+        else:
+            self.stable = 0
+        self.previous = current
+        if self.stable >= self.patience:
+            self.stopped_at = step
+        return self.stopped_at is not None
+
+    def settled(self, before, after):
+        for agent_type, now in after.items():
+            then = before.get(agent_type)
+            if then is None or now is None:
+                if then is not now:
+                    return False
+                continue
+            if abs(now[0] - then[0]) > self.mean_shift or abs(now[1] - then[1]) > self.variance_shift:
+                return False
+            if 0.5 * np.abs(now[2] - then[2]).sum() > self.histogram_distance:
+                return False
+        return True
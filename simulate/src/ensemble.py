@@ -0,0 +1,115 @@
+import os
+import numpy as np
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+from model import World
+from logsink import LogSink
+from exposure import ExposureTracking
+from config import OUTPUT_DIR
+from profiling import Profiler
+from trajectory import TrajectoryWriter
+from aggregates import aggregates_path
+
+LOG_DIR = os.path.join(OUTPUT_DIR, 'logs')
+
+
+def replicate_seeds(seed, number_of_simulations):
+    """
+    One independent seed per replicate, spawned from a single base seed. Replicate i always gets
+    the same seed, however many workers there are or however the runs are chunked.
+    """
+    seed_sequence = np.random.SeedSequence(seed)
+    return [int(s.generate_state(1)[0]) for s in seed_sequence.spawn(number_of_simulations)]
+
+
+def profile_path(log_dir, simulation_id):
+    return os.path.join(log_dir, f'simulation_{simulation_id}', 'profile.csv')
+
+
+def build_world(params, seed, log_sink, trajectory=None):
+    """
+    A World set up from `params` (a config.Config), logging to `log_sink` and writing its
+    beliefs to `trajectory` (a trajectory.TrajectoryWriter), if given.
+    """
+    return World(
+        num_scientists = params['num_scientists'],
+        num_citizens = params['num_citizens'],
+        num_journalists = params['num_journalists'],
+        num_propagandists = params['num_propagandists'],
+        num_policymakers = params['num_policymakers'],
+        width = params['grid_width'],
+        height = params['grid_height'],
+        moore = params['moore'],
+        include_center = params['include_center'],
+        params = params,
+        vectorized_citizens = params['vectorized_citizens'],
+        vectorized_scientists = params['vectorized_scientists'],
+        log_sink = log_sink,
+        trajectory = trajectory,
+        seed = seed,
+        exposure = ExposureTracking(
+            params['exposure_tracking'],
+            ring_size = params['exposure_ring_size'],
+            bins = params['exposure_sketch_bins']
+        ),
+        collect_every = params['collect_every'],
+        collect_sample = params['collect_sample'],
+        expected_steps = params['steps_per_model']
+    )
+
+
+def run_replicate(simulation_id, seed, params, log_dir=LOG_DIR, trajectory_dir=None):
+    """
+    Build and run one World from `params` (a config.Config), returning its agent-step DataFrame
+    tagged with the SimulationID. Interaction and travel logs go to their own directory,
+    log_dir/simulation_<id>, and so does the profile report when params['profile'] is on.
+    With a `trajectory_dir` (a store made by trajectory.create_store_for) the replicate also
+    writes its beliefs into row simulation_id of that store.
+    """
+    log_sink = LogSink(os.path.join(log_dir, f'simulation_{simulation_id}'), format=params['log_format'])
+    trajectory = TrajectoryWriter(trajectory_dir, simulation_id) if trajectory_dir is not None else None
+    profiler = Profiler(enabled=params['profile'])
+    try:
+        with profiler:
+            run = build_world(params, seed, log_sink, trajectory)
+            for j in range(params['steps_per_model']):
+                run.step()
+                if not run.running:
+                    break
+            log_sink.flush()
+            if trajectory is not None:
+                trajectory.flush()
+    finally:
+        log_sink.close()
+    if profiler.enabled:
+        profiler.report().to_csv(profile_path(log_dir, simulation_id), index=False)
+    if run.aggregates is not None:
+        run.aggregates.state().to_csv(aggregates_path(log_dir, simulation_id), index=False)
+
+    agent_beliefs = run.get_agent_vars_dataframe().reset_index()
+    agent_beliefs['SimulationID'] = simulation_id
+    # with early stopping, how long the run actually went (see convergence.py)
+    if run.convergence is not None:
+        agent_beliefs['Steps Run'] = run.schedule.steps
+        agent_beliefs['Converged'] = run.convergence.stopped_at is not None
+    return simulation_id, agent_beliefs
+
+
+def run_ensemble(params, number_of_simulations, seed=None, workers=1, chunksize=1, log_dir=LOG_DIR, trajectory_dir=None):
+    """
+    Run replicates 0..number_of_simulations-1, each in a worker process with its own seed, and
+    yield (simulation_id, agent_beliefs) in SimulationID order as they come back.
+    workers=1 runs everything in this process.
+    """
+    seeds = replicate_seeds(seed, number_of_simulations)
+    simulation_ids = range(number_of_simulations)
+    if workers == 1:
+        for simulation_id, replicate_seed in zip(simulation_ids, seeds):
+            yield run_replicate(simulation_id, replicate_seed, params, log_dir, trajectory_dir)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(
+            run_replicate, simulation_ids, seeds, repeat(params), repeat(log_dir), repeat(trajectory_dir),
+            chunksize=chunksize
+            )
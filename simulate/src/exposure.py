@@ -0,0 +1,226 @@
+import numpy as np
+
+# Exposure tracking
+# -----------------
+# What agents remember about the beliefs and stories they encounter (`beliefs_encountered`).
+#
+#   'full'    every value, in a list (the original behaviour, only for small debug runs)
+#   'stats'   running count, mean, std, min and max
+#   'sketch'  a fixed-bin histogram over [0, 1], reported as a few quantiles
+#   'ring'    the most recent `ring_size` values
+#
+# Everything except 'full' uses constant memory per agent, and the data collector only records
+# the summary fields below instead of the whole history.
+
+FIELDS = {
+    'full': ['Beliefs Encountered'],
+    'stats': ['Exposure Count', 'Exposure Mean', 'Exposure Std', 'Exposure Min', 'Exposure Max'],
+    'sketch': ['Exposure Count', 'Exposure Q10', 'Exposure Q50', 'Exposure Q90'],
+    'ring': ['Exposure Count', 'Recent Beliefs Encountered'],
+}
+SKETCH_QUANTILES = (0.1, 0.5, 0.9)
+
+
+def histogram_quantiles(counts, quantiles):
+    """
+    Quantiles of values binned evenly over [0, 1], interpolating linearly inside a bin.
+    `counts` is (agents, bins), returns (agents, len(quantiles)), NaN for agents with no values.
+    """
+    counts = np.atleast_2d(counts)
+    bins = counts.shape[1]
+    total = counts.sum(axis=1)
+    cumulative = np.cumsum(counts, axis=1)
+    out = np.full((len(counts), len(quantiles)), np.nan)
+    rows = np.arange(len(counts))
+    for k, q in enumerate(quantiles):
+        target = q * total
+        b = np.minimum((cumulative < target[:, None]).sum(axis=1), bins - 1)
+        below = np.where(b > 0, cumulative[rows, np.maximum(b - 1, 0)], 0)
+        in_bin = counts[rows, b]
+        fraction = np.divide(target - below, in_bin, out=np.zeros(len(counts)), where=in_bin > 0)
+        out[:, k] = np.where(total > 0, (b + fraction) / bins, np.nan)
+    return out
+
+
+class FullHistory(list):
+    """
+    Every value encountered.
+    """
+    def summary(self):
+        return (self,)
+
+
+class RunningStats:
+    """
+    Count, mean, std, min and max, updated one value at a time (Welford).
+    """
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def append(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def summary(self):
+        if self.count == 0:
+            return (0, None, None, None, None)
+        return (self.count, self.mean, (self.m2 / self.count) ** 0.5, self.min, self.max)
+
+
+class QuantileSketch:
+    """
+    Counts of values in `bins` equal-width bins over [0, 1].
+    """
+    __slots__ = ('counts',)
+
+    def __init__(self, bins=20):
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    def append(self, value):
+        bins = len(self.counts)
+        self.counts[min(max(int(value * bins), 0), bins - 1)] += 1
+
+    def summary(self):
+        count = int(self.counts.sum())
+        if count == 0:
+            return (0, None, None, None)
+        return (count, *histogram_quantiles(self.counts, SKETCH_QUANTILES)[0].tolist())
+
+
+class RingBuffer:
+    """
+    The last `size` values encountered.
+    """
+    __slots__ = ('values', 'count')
+
+    def __init__(self, size=20):
+        self.values = np.empty(size)
+        self.count = 0
+
+    def append(self, value):
+        self.values[self.count % len(self.values)] = value
+        self.count += 1
+
+    def summary(self):
+        size = len(self.values)
+        if self.count <= size:
+            return (self.count, self.values[:self.count].tolist())
+        start = self.count % size
+        return (self.count, np.concatenate([self.values[start:], self.values[:start]]).tolist())
+
+
+class ExposureArrays:
+    """
+    The same summaries for a whole array-backed population at once. add(i, values) records one
+    value for each agent in i (no repeats within a call).
+    """
+    def __init__(self, n, mode, ring_size=20, bins=20):
+        self.mode = mode
+        self.fields = FIELDS[mode]
+        self.count = np.zeros(n, dtype=np.int64)
+        if mode == 'stats':
+            self.mean = np.zeros(n)
+            self.m2 = np.zeros(n)
+            self.min = np.full(n, np.inf)
+            self.max = np.full(n, -np.inf)
+        elif mode == 'sketch':
+            self.counts = np.zeros((n, bins), dtype=np.int32)
+        elif mode == 'ring':
+            self.values = np.full((n, ring_size), np.nan)
+
+    def add(self, i, values):
+        if self.mode == 'stats':
+            self.count[i] += 1
+            delta = values - self.mean[i]
+            self.mean[i] += delta / self.count[i]
+            self.m2[i] += delta * (values - self.mean[i])
+            self.min[i] = np.minimum(self.min[i], values)
+            self.max[i] = np.maximum(self.max[i], values)
+        elif self.mode == 'sketch':
+            bins = self.counts.shape[1]
+            self.counts[i, np.clip((values * bins).astype(np.int64), 0, bins - 1)] += 1
+            self.count[i] += 1
+        elif self.mode == 'ring':
+            self.values[i, self.count[i] % self.values.shape[1]] = values
+            self.count[i] += 1
+
+    def summary(self):
+        """
+        {field: column} for the collector, in the same shape as the per-agent trackers report.
+        """
+        seen = self.count > 0
+        if self.mode == 'stats':
+            std = np.sqrt(np.divide(self.m2, self.count, out=np.zeros(len(self.count)), where=seen))
+            columns = [self.count.copy()] + [np.where(seen, c, np.nan) for c in (self.mean, std, self.min, self.max)]
+        elif self.mode == 'sketch':
+            q = histogram_quantiles(self.counts, SKETCH_QUANTILES)
+            columns = [self.count.copy()] + [q[:, k] for k in range(len(SKETCH_QUANTILES))]
+        else:
+            size = self.values.shape[1]
+            # roll each row so the values come out oldest first
+            start = np.where(self.count > size, self.count % size, 0)
+            order = (start[:, None] + np.arange(size)) % size
+            recent = np.take_along_axis(self.values, order, axis=1)
+            columns = [self.count.copy(), [r[~np.isnan(r)].tolist() for r in recent]]
+        return dict(zip(self.fields, columns))
+
+
+class ExposureTracking:
+    """
+    Which kind of exposure memory the agents in a World get, and what the collector records.
+    """
+    def __init__(self, mode='full', ring_size=20, bins=20):
+        if mode not in FIELDS:
+            raise ValueError(f"Unknown exposure tracking mode '{mode}', expected one of {list(FIELDS)}")
+        self.mode = mode
+        self.ring_size = ring_size
+        self.bins = bins
+        self.fields = FIELDS[mode]
+
+    def new_tracker(self):
+        if self.mode == 'full':
+            return FullHistory()
+        if self.mode == 'stats':
+            return RunningStats()
+        if self.mode == 'sketch':
+            return QuantileSketch(self.bins)
+        return RingBuffer(self.ring_size)
+
+    def new_arrays(self, n):
+        """
+        Array-backed populations can't keep full histories, so 'full' means no tracking there.
+        """
+        if self.mode == 'full':
+            return None
+        return ExposureArrays(n, self.mode, self.ring_size, self.bins)
+
+    def reporters(self):
+        """
+        DataCollector agent reporters for the exposure fields.
+        """
+        if self.mode == 'full':
+            return {'Beliefs Encountered': 'beliefs_encountered'}
+        return {field: SummaryReporter(k) for k, field in enumerate(self.fields)}
+
+
+class SummaryReporter:
+    """
+    Reports field k of an agent's exposure summary. A class rather than a closure so that
+    Worlds (and their collectors) can be pickled, see checkpoint.py.
+    """
+    def __init__(self, k):
+        self.k = k
+
+    def __call__(self, agent):
+        tracker = agent.beliefs_encountered
+        return None if tracker is None else tracker.summary()[self.k]
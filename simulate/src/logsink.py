@@ -0,0 +1,215 @@
+import os
+import csv
+import json
+import queue
+import atexit
+import threading
+import numpy as np
+
+from config import OUTPUT_DIR
+
+AGENT_TYPES = ['scientists', 'journalists', 'policymakers', 'citizens', 'propagandists']
+
+# LOG STREAMS AND THEIR COLUMNS
+STREAMS = {}
+for agent_type in AGENT_TYPES:
+    if agent_type == 'journalists':
+        STREAMS[f'interactions_{agent_type}'] = [('i', 'int64'), ('j', 'int64'), ('step', 'int64')]
+    else:
+        STREAMS[f'interactions_{agent_type}'] = [
+            ('i', 'int64'), ('j', 'int64'), ('ij_belief_difference', 'float64'), ('update_boolean', 'bool'), ('step', 'int64')
+            ]
+    STREAMS[f'travel_{agent_type}'] = [('agent', 'int64'), ('x', 'int64'), ('y', 'int64'), ('step', 'int64')]
+
+
+def read_columns(path):
+    """
+    Open one stream written in the 'columnar' format as a dict of memory-mapped NumPy columns.
+    """
+    with open(os.path.join(path, 'schema.json')) as file:
+        schema = json.load(file)
+    columns = {}
+    for name, dtype in schema['columns']:
+        filename = os.path.join(path, f'{name}.bin')
+        if os.path.getsize(filename) == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(filename, dtype=dtype, mode='r')
+    return columns
+
+
+class LogSink:
+    """
+    Collects interaction and travel log rows in memory and writes them out in bulk from a
+    background thread, instead of opening and closing a file for every event.
+
+    Rows are handed to the writer thread every `flush_rows` rows. At most `max_pending` of those
+    batches wait in the queue, after that the simulation blocks until the writer catches up, so
+    memory stays bounded. `close()` (also run at interpreter exit) flushes whatever is left.
+
+    format='csv' writes ../output/<stream>.csv like before. format='columnar' writes a directory
+    per stream with one raw binary file per column and a schema.json (see read_columns).
+    With append=True existing logs are added to instead of replaced (e.g. resuming a checkpoint).
+    """
+    def __init__(self, directory=OUTPUT_DIR, format='csv', flush_rows=100_000, max_pending=8, append=False):
+        if format not in ('csv', 'columnar'):
+            raise ValueError(f"Unknown log format '{format}', expected 'csv' or 'columnar'")
+        self.directory = directory
+        self.format = format
+        self.flush_rows = flush_rows
+        self.append = append
+        self.closed = False
+
+        self._rows = {stream: [] for stream in STREAMS}
+        self._batches = {stream: [] for stream in STREAMS}
+        self._buffered = 0
+        self._error = None
+        self._files = self._open_files()
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._write_batches, name='log-sink', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _open_files(self):
+        """
+        Prepare files for logging, clearing results from previous runs and writing headers
+        (or, when appending, carrying on at the end of what's there).
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        files = {}
+        for stream, columns in STREAMS.items():
+            if self.format == 'csv':
+                filename = os.path.join(self.directory, f'{stream}.csv')
+                resume = self.append and os.path.exists(filename) and os.path.getsize(filename) > 0
+                file = open(filename, 'a' if resume else 'w', newline='')
+                if not resume:
+                    file.write(','.join(name for name, _ in columns) + '\n')
+                files[stream] = (file, csv.writer(file, lineterminator='\n'))
+            else:
+                path = os.path.join(self.directory, stream)
+                os.makedirs(path, exist_ok=True)
+                with open(os.path.join(path, 'schema.json'), 'w') as schema:
+                    json.dump({'columns': columns}, schema)
+                mode = 'ab' if self.append else 'wb'
+                files[stream] = [open(os.path.join(path, f'{name}.bin'), mode) for name, _ in columns]
+        return files
+
+    def write(self, stream, row):
+        """
+        Log one row (a tuple in the stream's column order).
+        """
+        self._rows[stream].append(row)
+        self._buffered += 1
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def write_columns(self, stream, columns):
+        """
+        Log a batch of rows given as one array per column, e.g. from an array-backed population.
+        """
+        self._seal(stream)
+        self._batches[stream].append(columns)
+        self._buffered += len(columns[0])
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def _seal(self, stream):
+        # turn buffered rows into a column batch, keeping them in order with write_columns batches
+        rows = self._rows[stream]
+        if rows:
+            self._batches[stream].append(list(zip(*rows)))
+            self._rows[stream] = []
+
+    def flush(self):
+        """
+        Hand everything buffered so far to the writer thread.
+        """
+        for stream in STREAMS:
+            self._seal(stream)
+        batches = {stream: b for stream, b in self._batches.items() if b}
+        self._batches = {stream: [] for stream in STREAMS}
+        self._buffered = 0
+        if self._error is not None:
+            raise self._error
+        if batches:
+            self._queue.put(batches)
+
+    def _write_batches(self):
+        while True:
+            batches = self._queue.get()
+            if batches is None:
+                break
+            if self._error is not None:
+                continue # keep draining so the simulation never blocks on a dead writer
+            try:
+                for stream, column_batches in batches.items():
+                    for columns in column_batches:
+                        self._write_columns(stream, columns)
+            except Exception as e:
+                self._error = e
+
+    def _write_columns(self, stream, columns):
+        dtypes = [dtype for _, dtype in STREAMS[stream]]
+        if self.format == 'csv':
+            file, writer = self._files[stream]
+            # plain python values, so floats and booleans print the same way the old f-strings did
+            values = [np.asarray(c, dtype=dtype).tolist() for c, dtype in zip(columns, dtypes)]
+            writer.writerows(zip(*values))
+        else:
+            for file, c, dtype in zip(self._files[stream], columns, dtypes):
+                np.asarray(c, dtype=dtype).tofile(file)
+
+    def close(self):
+        """
+        Flush everything, stop the writer thread and close the files. Safe to call more than once.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+            for handles in self._files.values():
+                if self.format == 'csv':
+                    handles[0].close()
+                else:
+                    for file in handles:
+                        file.close()
+        if self._error is not None:
+            raise self._error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class NullSink:
+    """
+    A LogSink that throws everything away. What a World logs to unless it's given a sink, so
+    building one never touches the files in ../output (the drivers pass real LogSinks).
+    """
+    closed = False
+
+    def write(self, stream, row):
+        pass
+
+    def write_columns(self, stream, columns):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
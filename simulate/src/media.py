@@ -0,0 +1,56 @@
+import numpy as np
+
+# Media snapshots
+# ---------------
+# Under the staged schedule (see World.staged_step) scientists, propagandists and journalists all
+# update first, then what the media put out is frozen into a MediaSnapshot, and every citizen and
+# policymaker reads from that. The arrays are read-only copies, so nothing in the consumer phase
+# can change what anyone else reads, whatever order (or thread) they update in.
+#
+# The World publishes the last step's as world.media. Under the random schedule it's only frozen
+# when something reads it (nothing in the model does, consumers read the live registry). Along with the stories it keeps where the science stood: the smallest, largest and
+# quantiles of the scientists' posterior means, read off the registry's OrderIndex.
+
+# quantiles of the scientists' posterior means kept in each snapshot
+SCIENCE_QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+
+
+def _frozen(values):
+    values = np.array(values, copy=True)
+    values.setflags(write=False)
+    return values
+
+
+class MediaSnapshot:
+    """
+    The journalists' and propagandists' stories (and who wrote them) at one step, and the
+    spread of the scientists' posterior means: `science_min`, `science_max` and
+    `science_quantiles` (at SCIENCE_QUANTILES).
+    """
+    def __init__(self, step, journalist_ids, journalist_stories, propagandist_ids, propagandist_stories, science=None):
+        self.step = step
+        self.ids = {'Journalist': _frozen(journalist_ids), 'Propagandist': _frozen(propagandist_ids)}
+        self.story = {'Journalist': _frozen(journalist_stories), 'Propagandist': _frozen(propagandist_stories)}
+        if science is None:
+            self.science_min = self.science_max = np.nan
+            self.science_quantiles = _frozen(np.full(len(SCIENCE_QUANTILES), np.nan))
+        else:
+            self.science_min = float(science.min())
+            self.science_max = float(science.max())
+            self.science_quantiles = _frozen(science.quantile(SCIENCE_QUANTILES))
+
+    @classmethod
+    def freeze(cls, registry, step):
+        science = registry.index('Scientist', 'posterior_mean') if registry.count('Scientist') else None
+        return cls(
+            step,
+            registry.unique_ids('Journalist'), registry.stories('Journalist'),
+            registry.unique_ids('Propagandist'), registry.stories('Propagandist'),
+            science,
+            )
+
+    def stories(self, agent_type):
+        return self.story[agent_type]
+
+    def unique_ids(self, agent_type):
+        return self.ids[agent_type]
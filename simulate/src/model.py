@@ -1,97 +1,241 @@
+import random
+
 from mesa import Model
-from mesa.space import MultiGrid
 from mesa.time import RandomActivation
-from mesa.datacollection import DataCollector
 
 from scientists import BayesianScientist
 from propagandists import Propagandist
 from citizens import Citizen
 from journalists import Journalist
 from policymakers import Policymaker
+from citizen_population import CitizenPopulation
+from scientist_population import ScientistPopulation
+from registry import AgentRegistry
+from logsink import NullSink
+from exposure import ExposureTracking
+from collector import TypedCollector
+from space import CellGrid
+from media import MediaSnapshot
+from rng import RandomStreams
+from topology import make_topology
+from convergence import ConvergenceMonitor
+from aggregates import Aggregates
+from config import load_config
+
+
+def agent_reporters(exposure):
+    """The columns collected for each agent type."""
+    belief = {'Belief (After All Step Actions)': 'belief'}
+    belief_stages = {
+        'Belief After Talk': 'belief_after_talk',
+        'Belief After Talk Media': 'belief_after_talk_media',
+        'Belief After Talk Media Propaganda': 'belief_after_talk_media_propaganda',
+        }
+    return {
+        'Scientist': {
+            'Prior': 'prior',
+            'Prior Mean': 'prior_mean',
+            'Posterior': 'posterior',
+            'Posterior Mean': 'posterior_mean',
+            **belief
+            },
+        'Journalist': {'Story': 'story', **belief, **exposure.reporters()},
+        'Propagandist': {'Story': 'story', **belief},
+        'Citizen': {**belief, **belief_stages, **exposure.reporters()},
+        'Policymaker': {**belief, **belief_stages, **exposure.reporters()},
+        }
 
 
 class World(Model):
-    """The model our agents live in."""
-    def __init__(self, num_scientists, num_citizens, num_journalists, num_propagandists, num_policymakers, width, height):
+    """The model our agents live in. `seed` seeds every random draw in the run, see rng.py.
+    `params` is a config.Config, the agents read their thresholds etc. from it (default: parameters.yaml)."""
+    def __init__(self, num_scientists, num_citizens, num_journalists, num_propagandists, num_policymakers, width, height, moore=True, include_center=True, params=None, vectorized_citizens=False, vectorized_scientists=False, log_sink=None, seed=None, exposure=None, collect_every=1, collect_sample=None, expected_steps=None, topology=None, trajectory=None):
         
-        self.grid = MultiGrid(width, height, True)
+        # model parameters, loaded once and shared with the agents
+        self.params = params if params is not None else load_config()
+        # random numbers for the World and each agent type
+        self.reseed(seed)
+        # interaction and travel logs, buffered and written in bulk (pass a LogSink in to keep them, nothing is written otherwise)
+        self.log = log_sink if log_sink is not None else NullSink()
+        # what agents remember about the beliefs they encounter, the full history by default
+        self.exposure = exposure if exposure is not None else ExposureTracking('full')
+        # torus grid with per-cell, per-type buckets, see space.py
+        self.grid = CellGrid(width, height, moore, include_center)
+        # where every step's beliefs go on disk, if anywhere, see trajectory.py
+        self.trajectory = trajectory
+        # per-step, per-type belief summaries kept as the run goes (with `aggregates: true`), see aggregates.py
+        self.aggregates = Aggregates.from_params(self.params) if self.params['aggregates'] else None
+        # stop early once beliefs settle (with `convergence: true`), see convergence.py
+        self.running = True
+        self.convergence = ConvergenceMonitor.from_params(self.params) if self.params['convergence'] else None
+        # who picks discussion partners from whom, the grid by default, see topology.py
+        sizes = {'Scientist': num_scientists, 'Citizen': num_citizens, 'Policymaker': num_policymakers}
+        self.topology = topology if topology is not None else make_topology(self.params, sizes, self.rng['World'])
         self.schedule = RandomActivation(self)
+        # agents indexed by type, so nobody has to scan the whole schedule to find their peers
+        self.registry = AgentRegistry()
+        # what the media put out (see media.py, frozen when asked for, see `media`), and the
+        # snapshot the consumers are reading from during the staged schedule's consumer phase
+        self._media = None
+        self.snapshot = None
         
         #####################
         ### CREATE AGENTS ###
         #####################
 
-        # Bayesian Scientists
+        # Bayesian Scientists, either as one array-backed population or one agent per scientist
+        self.scientists = None
+        if vectorized_scientists:
+            self.scientists = ScientistPopulation(num_scientists, self)
+            self.registry.attach(self.scientists)
+            num_scientists = 0
         for scientist_i in range(num_scientists):
-            scientist = BayesianScientist(scientist_i, self)
-            self.schedule.add(scientist)
-
-            # Add the agent to a random grid cell
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            self.grid.place_agent(scientist, (x, y))
+            self.add_agent(BayesianScientist(scientist_i, self))
 
         # Journalists
         for journalist_i in range(num_journalists):
-            journalist = Journalist(journalist_i, self)
-            self.schedule.add(journalist)
-
-            # Add the agent to a random grid cell
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            self.grid.place_agent(journalist, (x, y))
+            self.add_agent(Journalist(journalist_i, self))
 
         # Propagandists
         for propagandist_i in range(num_propagandists):
-            propagandist = Propagandist(propagandist_i, self)
-            self.schedule.add(propagandist)
-
-            # Add the agent to a random grid cell
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            self.grid.place_agent(propagandist, (x, y))
-
-        # Citizens
+            self.add_agent(Propagandist(propagandist_i, self))
+
+        # Citizens, either as one array-backed population or one agent per person
+        self.citizens = None
+        if vectorized_citizens:
+            self.citizens = CitizenPopulation(num_citizens, self)
+            self.registry.attach(self.citizens)
+            num_citizens = 0
         for citizen_i in range(num_citizens):
-            citizen = Citizen(citizen_i, self)
-            self.schedule.add(citizen)
-
-            # Add the agent to a random grid cell
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            self.grid.place_agent(citizen, (x, y))
+            self.add_agent(Citizen(citizen_i, self))
 
         # Policymakers
         for policymaker_i in range(num_policymakers):
-            policymaker = Policymaker(policymaker_i, self)
-            self.schedule.add(policymaker)
-
-            # Add the agent to a random grid cell
-            x = self.random.randrange(self.grid.width)
-            y = self.random.randrange(self.grid.height)
-            self.grid.place_agent(policymaker, (x, y))
+            self.add_agent(Policymaker(policymaker_i, self))
 
         #####################################
         #### COLLECT DATA FROM MODEL RUNS ###
         #####################################
 
-        self.datacollector = DataCollector(
-            agent_reporters={
-                'Agent Type':'agent_type',
-                "Prior":"prior", 
-                "Prior Mean":"prior_mean",
-                "Posterior":'posterior', 
-                "Posterior Mean":"posterior_mean",
-                'Story':'story',
-                'Belief (After All Step Actions)':'belief',
-                'Belief After Talk':'belief_after_talk',
-                'Belief After Talk Media':'belief_after_talk_media',
-                'Belief After Talk Media Propaganda':'belief_after_talk_media_propaganda',
-                'Beliefs Encountered':'beliefs_encountered'
-                }
+        # only the columns each type actually has, see collector.py
+        self.datacollector = TypedCollector(
+            agent_reporters(self.exposure),
+            every = collect_every,
+            sample = collect_sample,
+            expected_steps = expected_steps,
+            seed = seed
             )
 
+    def reseed(self, seed):
+        '''Fresh random streams from `seed` (None for fresh entropy).'''
+        self.rng = RandomStreams(seed, block=self.params['rng_block'])
+        # mesa's scheduler and the agent placement use self.random, seed it from the World's stream.
+        # (mesa 0.8.9's Model.__new__ puts its own RNG on the class, so every new World, or unpickled
+        # one, would reseed all the others. This one lives on the instance.)
+        self.random = random.Random(self.rng['World'].integers(0, 2**62))
+
+    def __getstate__(self):
+        '''Everything but the log sink (open files and a thread) and the trajectory store (files on disk), see checkpoint.py.'''
+        state = self.__dict__.copy()
+        state['log'] = None
+        state['trajectory'] = None
+        return state
+
+    def add_agent(self, agent):
+        '''Schedule the agent, index it by type and drop it in a random grid cell.'''
+        self.schedule.add(agent)
+        self.registry.add(agent)
+        x = self.random.randrange(self.grid.width)
+        y = self.random.randrange(self.grid.height)
+        self.grid.place_agent(agent, (x, y))
+
+    def remove_agent(self, agent):
+        '''Take the agent out of the schedule, the registry and the grid.'''
+        self.schedule.remove(agent)
+        self.registry.remove(agent)
+        self.grid.remove_agent(agent)
+
     def step(self):
-        '''Advance the model by one step.'''
-        self.datacollector.collect(self)
-        self.schedule.step()
\ No newline at end of file
+        '''Advance the model by one step, unless its beliefs have converged (then self.running goes False and nothing moves).'''
+        if not self.running:
+            return
+        step = self.schedule.steps
+        if self.params['collect_agents']:
+            self.datacollector.collect(self, step)
+        if self.aggregates is not None:
+            self.aggregates.update(self, step)
+        if self.trajectory is not None:
+            self.trajectory.write(self, step)
+        if self.convergence is not None and self.convergence.observe(self, step):
+            self.running = False
+            return
+        if self.params['schedule'] == 'staged':
+            self.staged_step(step)
+            return
+        # science happens first, so journalists and propagandists read this step's posteriors
+        if self.scientists is not None:
+            self.scientists.step(step)
+            self.registry.refresh('Scientist')
+        self.schedule.step()
+        # nobody reads citizen beliefs, so they can go last
+        if self.citizens is not None:
+            self.citizens.step(step)
+
+    @property
+    def media(self):
+        '''
+        What the media put out at the last step, as a MediaSnapshot (None before the first step).
+        The staged schedule freezes one anyway, the random schedule only when someone asks.
+        '''
+        step = self.schedule.steps - 1
+        if step < 0:
+            return None
+        if self._media is None or self._media.step != step:
+            self._media = MediaSnapshot.freeze(self.registry, step)
+        return self._media
+
+    def staged_step(self, step):
+        '''
+        One step of the staged schedule. The producers go first, each type in turn (scientists,
+        then propagandists, then journalists, who read both), then their stories are frozen into a
+        MediaSnapshot and the consumers (citizens, then policymakers) all update against it. The
+        array-backed citizens update in `threads` threads, see CitizenPopulation.staged_step.
+        '''
+        if self.scientists is not None:
+            self.scientists.step(step)
+            self.registry.refresh('Scientist')
+        for agent_type in ('Scientist', 'Propagandist', 'Journalist'):
+            self.step_type(agent_type)
+        self._media = self.snapshot = MediaSnapshot.freeze(self.registry, step)
+        try:
+            if self.citizens is not None:
+                self.citizens.staged_step(step, self.snapshot, threads=self.params['threads'])
+            for agent_type in ('Citizen', 'Policymaker'):
+                self.step_type(agent_type)
+        finally:
+            self.snapshot = None
+        self.schedule.steps += 1
+        self.schedule.time += 1
+
+    def step_type(self, agent_type):
+        '''Step every agent of one type, in random order (nothing to do for array-backed types).'''
+        if agent_type in self.registry.populations:
+            return
+        agents = list(self.registry.agents(agent_type))
+        self.random.shuffle(agents)
+        for agent in agents:
+            agent.step()
+
+    def stories(self, agent_type):
+        '''The stories consumers read: the frozen snapshot's during the staged consumer phase, the live ones otherwise.'''
+        if self.snapshot is not None:
+            return self.snapshot.stories(agent_type)
+        return self.registry.stories(agent_type)
+
+    def get_agent_vars_dataframe(self):
+        '''Agent-step data for every agent, including the array-backed populations.'''
+        return self.datacollector.get_agent_vars_dataframe()
+
+    def populations(self):
+        '''The array-backed agent populations in use.'''
+        return [p for p in (self.scientists, self.citizens) if p is not None]
\ No newline at end of file
@@ -1,72 +1,60 @@
-import yaml
-import random 
 import numpy as np
-from mesa import Agent
+from registry import IndexedAgent, Tracked
 
-# LOAD MODEL PARAMETERS
-with open(r'../input/parameters.yaml') as params:
-    params = yaml.load(params, Loader=yaml.FullLoader)
 
-class Policymaker(Agent):
+class Policymaker(IndexedAgent):
     """
     Simulated policymaker trying to make policy...
     """
+    __slots__ = ('_belief_after_talk', '_belief_after_talk_media', '_belief_after_talk_media_propaganda', 'beliefs_encountered')
+    agent_type = 'Policymaker'
+    belief_after_talk = Tracked()
+    belief_after_talk_media = Tracked()
+    belief_after_talk_media_propaganda = Tracked()
+
     def __init__(self, unique_id, model):
         super().__init__(unique_id+50_000_000, model)
-        self.agent_type = 'Policymaker'
 
         # BELIEF VARIABLES
-        self.belief = float(np.random.uniform(0, 1, 1)) # some population heterogeneity in initial beliefs
+        self.belief = self.rng.uniform(0, 1) # some population heterogeneity in initial beliefs
         self.belief_after_talk = None  
         self.belief_after_talk_media = None
         self.belief_after_talk_media_propaganda = None
-        self.beliefs_encountered = []
-
-        # SATISFY THE DATA COLLECTOR DURING MODEL RUNS
-        self.prior = None
-        self.prior_mean = None
-        self.posterior = None
-        self.posterior_mean = None
-        self.story = None
+        self.beliefs_encountered = model.exposure.new_tracker() # see exposure.py
         
-    def log_interaction(self, filename, alter, agent_threshold):
-        with open(filename, 'a') as file:
-            if abs(self.belief - alter.belief) < agent_threshold:
-                update = True 
-            else:
-                update = False
-            ij_belief_difference = self.belief - alter.belief 
-            s = f'{self.unique_id},{alter.unique_id},{ij_belief_difference},{update},{self.model.schedule.steps}\n'
-            file.write(s)
+    def log_interaction(self, stream, alter, agent_threshold):
+        if abs(self.belief - alter.belief) < agent_threshold:
+            update = True 
+        else:
+            update = False
+        ij_belief_difference = self.belief - alter.belief 
+        self.model.log.write(stream, (self.unique_id, alter.unique_id, ij_belief_difference, update, self.model.schedule.steps))
 
     def interaction(self):
-        peers = []
-        for a in self.model.schedule.agents:
-            if a.agent_type == 'Policymaker':
-                peers.append(a)
-        # select N discussion partners, between 2 and 5
-        num_discussion_partners = int(np.random.randint(2,5,1))
-        discussion_partners = random.sample(peers, num_discussion_partners)
+        peers = self.model.topology.peers(self)
+        # select N discussion partners, between 2 and 5 (fewer if they don't know that many)
+        num_discussion_partners = min(self.rng.integers(2, 5), len(peers))
+        discussion_partners = self.rng.sample(peers, num_discussion_partners)
         # the interaction
         for partner in discussion_partners:
             # log the encountered belief
             self.beliefs_encountered.append(partner.belief)
             # updates belief or not
-            if abs(self.belief - partner.belief) < params['policymaker_difference_threshold']:
+            if abs(self.belief - partner.belief) < self.model.params['policymaker_difference_threshold']:
                 self.belief_after_talk = int(np.mean([self.belief, partner.belief]))
                 self.belief = self.belief_after_talk
             else:
                 self.belief_after_talk = self.belief
             # log the interaction metadata
-            self.log_interaction(filename='../output/interactions_policymakers.csv', alter=partner, agent_threshold=params['policymaker_difference_threshold'])
+            self.log_interaction(stream='interactions_policymakers', alter=partner, agent_threshold=self.model.params['policymaker_difference_threshold'])
 
     def consumes_news_media(self):
         # reading_options = []
-        journalists = [j.story for j in self.model.schedule.agents if j.agent_type == 'Journalist']
+        journalists = self.model.stories('Journalist')
         # the agent will read anywhere between 2 and 10 news stories
-        number_of_stories_to_read =  int(np.random.randint(2, 10, 1)) 
+        number_of_stories_to_read = self.rng.integers(2, 10)
         # sample stories to read
-        to_read = random.sample(journalists, number_of_stories_to_read)
+        to_read = journalists[self.rng.sample(range(len(journalists)), number_of_stories_to_read)].tolist()
         average_belief_in_stories = np.mean(to_read)
         weighted_opinion = np.average([self.belief_after_talk, average_belief_in_stories], weights=[0.7, 0.2]) # beliefs from the policy community matter more than journalists...
         self.belief_after_talk_media = weighted_opinion
@@ -77,16 +65,16 @@ class Policymaker(Agent):
         """
         All policymakers encounter propaganda, the question is how much...
         """
-        propagandists = [p.story for p in self.model.schedule.agents if p.agent_type == 'Propagandist']
+        propagandists = self.model.stories('Propagandist')
         # the agent will read anywhere between 5 and 10 pieces of bullshit
-        amount_of_bullshit_to_read = int(np.random.randint(5, 10, 1)) 
+        amount_of_bullshit_to_read = self.rng.integers(5, 10)
         # sample bullshit to read
-        to_read = random.sample(propagandists, amount_of_bullshit_to_read)
+        to_read = propagandists[self.rng.sample(range(len(propagandists)), amount_of_bullshit_to_read)].tolist()
         to_read.append(self.belief_after_talk_media)
         average_belief_in_bullshit = np.mean(to_read)
         weighted_opinion = np.average([self.belief_after_talk_media, average_belief_in_bullshit], weights=[0.8, 0.5]) # they still know some bullshit when they see it, so don't take it too seriously
-        self.belief_after_talk_media_propagandist = weighted_opinion 
-        self.belief = self.belief_after_talk_media_propagandist
+        self.belief_after_talk_media_propaganda = weighted_opinion
+        self.belief = self.belief_after_talk_media_propaganda
 
     def step(self):
         self.interaction()
@@ -0,0 +1,143 @@
+import os
+import time
+import functools
+import pandas as pd
+from mesa.time import RandomActivation
+
+from model import World
+from scientists import BayesianScientist
+from journalists import Journalist
+from propagandists import Propagandist
+from citizens import Citizen
+from policymakers import Policymaker
+from citizen_population import CitizenPopulation
+from scientist_population import ScientistPopulation
+from collector import TypedCollector
+from logsink import LogSink
+from aggregates import Aggregates
+from trajectory import TrajectoryWriter
+from convergence import ConvergenceMonitor
+
+# Profiling
+# ---------
+# With `profile: true` in parameters.yaml every replicate records, for each agent type and each
+# phase of World.step (the staged schedule's staged_step, data collection, the aggregates,
+# trajectory and convergence updates, the schedule and logging):
+#
+#   calls              how many times the method ran
+#   seconds            wall time inside it (inclusive, e.g. Citizen.step includes Citizen.move)
+#
+# There's no allocation count: CPython doesn't keep one (sys.getallocatedblocks() and tracemalloc
+# only see what's still allocated), and a net figure says nothing about the allocations a call
+# made and freed. For memory, run benchmark.py, which records each scenario's peak RSS.
+#
+# The methods are wrapped at the class level when a Profiler starts and unwrapped when it stops,
+# so with profiling off the model runs exactly the code it always did.
+
+# classes whose public methods are profiled, grouped by the agent's type
+AGENT_CLASSES = [
+    BayesianScientist, Journalist, Propagandist, Citizen, Policymaker, CitizenPopulation, ScientistPopulation,
+    ]
+# phases of World.step, and the logging in between
+PHASES = {
+    World: ['step', 'staged_step'],
+    TypedCollector: ['collect'],
+    Aggregates: ['update'],
+    TrajectoryWriter: ['write'],
+    ConvergenceMonitor: ['observe'],
+    RandomActivation: ['step'],
+    LogSink: ['write', 'write_columns', 'flush'],
+    }
+PHASE_NAMES = {
+    World: 'World', TypedCollector: 'collect', Aggregates: 'aggregates', TrajectoryWriter: 'trajectory',
+    ConvergenceMonitor: 'convergence', RandomActivation: 'schedule', LogSink: 'logging',
+    }
+
+
+class Profiler:
+    """
+    Call counts and wall time per (group, method). Use as a context manager around
+    the run; does nothing at all unless `enabled`. Only one can be active at a time.
+    """
+    active = None
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stats = {}
+        self._originals = []
+
+    def _wrap(self, cls, name, group):
+        original = cls.__dict__[name]
+        stats = self.stats
+
+        @functools.wraps(original)
+        def profiled(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                key = (group or args[0].agent_type, name)
+                record = stats.get(key)
+                if record is None:
+                    record = stats[key] = [0, 0.0]
+                record[0] += 1
+                record[1] += seconds
+        self._originals.append((cls, name, original))
+        setattr(cls, name, profiled)
+
+    def start(self):
+        if not self.enabled:
+            return
+        if Profiler.active is not None:
+            raise RuntimeError('Another Profiler is already running')
+        Profiler.active = self
+        for cls in AGENT_CLASSES:
+            for name, value in list(vars(cls).items()):
+                if callable(value) and not name.startswith('_'):
+                    self._wrap(cls, name, None)
+        for cls, names in PHASES.items():
+            for name in names:
+                self._wrap(cls, name, PHASE_NAMES[cls])
+
+    def stop(self):
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals = []
+        if Profiler.active is self:
+            Profiler.active = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def report(self):
+        """
+        One row per (group, method), slowest first.
+        """
+        rows = [
+            {'group': group, 'method': method, 'calls': calls, 'seconds': seconds,
+             'seconds_per_call': seconds / calls}
+            for (group, method), (calls, seconds) in self.stats.items()
+            ]
+        df = pd.DataFrame(rows, columns=['group', 'method', 'calls', 'seconds', 'seconds_per_call'])
+        return df.sort_values('seconds', ascending=False, ignore_index=True)
+
+
+def combine_reports(paths, output_path):
+    """
+    Stack the per-replicate reports ({simulation_id: path}) into one CSV with a SimulationID
+    column, skipping replicates that didn't write one.
+    """
+    frames = []
+    for simulation_id, path in paths.items():
+        if os.path.exists(path):
+            df = pd.read_csv(path)
+            df.insert(0, 'SimulationID', simulation_id)
+            frames.append(df)
+    if frames:
+        pd.concat(frames, ignore_index=True).to_csv(output_path, index=False)
+    return output_path
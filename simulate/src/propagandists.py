@@ -1,33 +1,22 @@
-import yaml
 import numpy as np
-from mesa import Agent
+from registry import IndexedAgent, Tracked
 
-# LOAD MODEL PARAMETERS
-with open(r'../input/parameters.yaml') as params:
-    params = yaml.load(params, Loader=yaml.FullLoader)
 
-class Propagandist(Agent):
+class Propagandist(IndexedAgent):
     """
     Simulated propagandist cherry picks studies from the low end of the belief distribution.
     They also "write stories" that people can read / listen to / watch / whatever.
     """
+    __slots__ = ('_story',)
+    agent_type = 'Propagandist'
+    story = Tracked()
+
     def __init__(self, unique_id, model):
         super().__init__(unique_id+30_000_000, model)
-        self.agent_type = 'Propagandist'
 
         # BELIEF VARIABLES
-        self.belief = float(np.random.uniform(0, 0.2, 1)) # their ideological bias
+        self.belief = self.rng.uniform(0, 0.2) # their ideological bias
         self.story = self.belief 
-
-        # SATISFY THE DATA COLLECTOR DURING MODEL RUNS
-        self.prior = None # scientists only
-        self.prior_mean = None # scientists only
-        self.posterior = None # scientists only
-        self.posterior_mean = None # scientists only
-        self.belief_after_talk = None # citizens and policymakers only
-        self.belief_after_talk_media = None # citizens and policymakers only
-        self.belief_after_talk_media_propaganda = None # citizens and policymakers only
-        self.beliefs_encountered = None # all give, no take
         
     # PROPAGANDIST MAKES PROPAGANDA
     def propogandist_writes_propaganda(self):
@@ -37,13 +26,10 @@ class Propagandist(Agent):
         """
         # biased, duh!
         propagandist_bias = self.belief
-        # all the science to cherry pick
-        science_options = []
+        # all the science to cherry pick, in order
+        science_options = self.model.registry.index('Scientist', 'posterior_mean')
         # cherry pick the science
-        for a in self.model.schedule.agents:
-            if a.agent_type == 'Scientist':
-                science_options.append(a.posterior_mean)
-        low_confidence_science = min(science_options)
+        low_confidence_science = science_options.min()
         weighted_bias = np.average([propagandist_bias, low_confidence_science], weights=[0.8, 0.4])
         self.story = float(weighted_bias)
 
@@ -0,0 +1,264 @@
+import numpy as np
+
+# agent attributes mirrored into contiguous per-type arrays
+TRACKED = (
+    'belief', 'belief_after_talk', 'belief_after_talk_media', 'belief_after_talk_media_propaganda',
+    'story', 'posterior_mean'
+    )
+
+
+class Tracked:
+    """
+    An agent attribute that writes through to its row in the World's registry, so other agents
+    can read every value for a type as one array instead of scanning the schedule. The agent's
+    own copy lives in the slot '_' + name, which the class has to declare.
+    """
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.private = '_' + name
+
+    def __get__(self, agent, owner=None):
+        if agent is None:
+            return self
+        return getattr(agent, self.private, None)
+
+    def __set__(self, agent, value):
+        setattr(agent, self.private, value)
+        table = getattr(agent, '_registry_table', None)
+        if table is not None:
+            column, row = table.columns[self.name], agent._registry_row
+            value = np.nan if value is None else value
+            index = table.indexes.get(self.name)
+            if index is not None:
+                index.update(row, column[row], value)
+            column[row] = value
+
+
+class IndexedAgent:
+    """
+    Base class for agents that the registry indexes by type. It's mesa's Agent (unique_id,
+    model, pos, step, advance, random) without the per-agent __dict__: agents are slotted,
+    each type declaring in __slots__ just the fields it uses and the Tracked attributes it has.
+    Tracked attributes a type doesn't have read as None (NaN in the registry). `agent_type` is
+    a class attribute.
+    """
+    __slots__ = ('unique_id', 'model', 'pos', '_registry_table', '_registry_row', '_belief')
+    agent_type = None
+    belief = Tracked()
+
+    def __init__(self, unique_id, model):
+        self.unique_id = unique_id
+        self.model = model
+        self.pos = None
+
+    def step(self):
+        pass
+
+    def advance(self):
+        pass
+
+    @property
+    def random(self):
+        return self.model.random
+
+    @property
+    def rng(self):
+        """This agent type's random stream, see rng.py."""
+        return self.model.rng[self.agent_type]
+
+
+class OrderIndex:
+    """
+    One tracked attribute of a type kept in sorted order, with the row each value came from, so
+    the smallest, the largest and any quantile are a lookup rather than a scan of the type. A
+    change moves one value to its new place (a binary search and a memmove). Ties are ordered by
+    row, so argmin() and argmax() pick the same rows np.argmin and np.argmax would.
+    """
+    def __init__(self, values):
+        self.rebuild(values)
+
+    def rebuild(self, values):
+        values = np.asarray(values, dtype=float)
+        self.rows = np.lexsort((np.arange(len(values)), values))
+        self.values = values[self.rows]
+        self.stale = False
+
+    def _position(self, value, row):
+        """Where (value, row) sits, or would go, in the sorted order."""
+        lo = np.searchsorted(self.values, value, 'left')
+        hi = np.searchsorted(self.values, value, 'right')
+        return lo + int(np.searchsorted(self.rows[lo:hi], row))
+
+    def update(self, row, old, new):
+        if self.stale or old == new:
+            return
+        p = self._position(old, row)
+        q = self._position(new, row)
+        values, rows = self.values, self.rows
+        if q > p:
+            # everything in between shifts down one to fill the hole at p
+            q -= 1
+            values[p:q] = values[p + 1:q + 1]
+            rows[p:q] = rows[p + 1:q + 1]
+        elif q < p:
+            values[q + 1:p + 1] = values[q:p]
+            rows[q + 1:p + 1] = rows[q:p]
+        values[q] = new
+        rows[q] = row
+
+    def min(self):
+        return self.values[0]
+
+    def max(self):
+        return self.values[-1]
+
+    def argmin(self):
+        return int(self.rows[0])
+
+    def argmax(self):
+        # the first row holding the largest value
+        return int(self.rows[np.searchsorted(self.values, self.values[-1], 'left')])
+
+    def quantile(self, q):
+        """
+        Quantile(s) q of the values, interpolated the way np.quantile does by default.
+        """
+        position = np.asarray(q, dtype=float) * (len(self.values) - 1)
+        lo = np.floor(position).astype(np.int64)
+        hi = np.minimum(lo + 1, len(self.values) - 1)
+        return self.values[lo] + (self.values[hi] - self.values[lo]) * (position - lo)
+
+
+class _TypeTable:
+    """
+    All agents of one type, plus their tracked attributes as growable contiguous arrays.
+    """
+    def __init__(self, capacity=16):
+        self.agents = []
+        self.size = 0
+        self.unique_id = np.empty(capacity, dtype=np.int64)
+        self.columns = {name: np.empty(capacity) for name in TRACKED}
+        # sorted views of some columns, see AgentRegistry.index
+        self.indexes = {}
+
+    def _grow(self):
+        capacity = 2 * len(self.unique_id)
+        self.unique_id = np.resize(self.unique_id, capacity)
+        for name in TRACKED:
+            self.columns[name] = np.resize(self.columns[name], capacity)
+
+    def add(self, agent):
+        if self.size == len(self.unique_id):
+            self._grow()
+        row = self.size
+        self.agents.append(agent)
+        self.unique_id[row] = agent.unique_id
+        for name in TRACKED:
+            value = getattr(agent, name, None)
+            self.columns[name][row] = np.nan if value is None else value
+        agent._registry_table = self
+        agent._registry_row = row
+        self.size += 1
+        self._invalidate()
+
+    def remove(self, agent):
+        # swap the last row into the hole so the arrays stay contiguous
+        row, last = agent._registry_row, self.size - 1
+        moved = self.agents[last]
+        self.agents[row] = moved
+        self.agents.pop()
+        self.unique_id[row] = self.unique_id[last]
+        for name in TRACKED:
+            self.columns[name][row] = self.columns[name][last]
+        moved._registry_row = row
+        agent._registry_table = None
+        self.size -= 1
+        self._invalidate()
+
+    def _invalidate(self):
+        # agents coming and going is rare, just re-sort the next time an index is asked for
+        for index in self.indexes.values():
+            index.stale = True
+
+    def values(self, name):
+        return self.columns[name][:self.size]
+
+
+class AgentRegistry:
+    """
+    Agents indexed by type. Keeps each type's agents, unique ids, beliefs, stories and posterior
+    means (and the belief_after_* stages) up to date as agents are added, removed or change their
+    minds, so a lookup costs the size of that type rather than a scan of the whole schedule.
+
+    Array-backed populations (e.g. CitizenPopulation) can be attached in place of agent objects,
+    they just need `agent_type`, `unique_id` and arrays named after the tracked attributes.
+    """
+    def __init__(self):
+        self.tables = {}
+        self.populations = {}
+        self.population_indexes = {}
+
+    def add(self, agent):
+        if agent.agent_type not in self.tables:
+            self.tables[agent.agent_type] = _TypeTable()
+        self.tables[agent.agent_type].add(agent)
+
+    def remove(self, agent):
+        self.tables[agent.agent_type].remove(agent)
+
+    def attach(self, population):
+        self.populations[population.agent_type] = population
+
+    def agents(self, agent_type):
+        if agent_type in self.populations:
+            raise TypeError(f'{agent_type} agents are array-backed, query their arrays instead')
+        table = self.tables.get(agent_type)
+        return table.agents if table is not None else []
+
+    def count(self, agent_type):
+        if agent_type in self.populations:
+            return len(self.populations[agent_type].unique_id)
+        table = self.tables.get(agent_type)
+        return table.size if table is not None else 0
+
+    def unique_ids(self, agent_type):
+        if agent_type in self.populations:
+            return self.populations[agent_type].unique_id
+        table = self.tables.get(agent_type)
+        return table.unique_id[:table.size] if table is not None else np.empty(0, dtype=np.int64)
+
+    def values(self, agent_type, name):
+        if agent_type in self.populations:
+            return getattr(self.populations[agent_type], name)
+        table = self.tables.get(agent_type)
+        return table.values(name) if table is not None else np.empty(0)
+
+    def beliefs(self, agent_type):
+        return self.values(agent_type, 'belief')
+
+    def stories(self, agent_type):
+        return self.values(agent_type, 'story')
+
+    def index(self, agent_type, name):
+        """
+        An OrderIndex over one tracked attribute of a type (e.g. the scientists' posterior means),
+        kept up to date as the agents change it. Populations replace their arrays wholesale, so
+        theirs is re-sorted the first time it's asked for after refresh(agent_type).
+        """
+        if agent_type in self.populations:
+            indexes = self.population_indexes.setdefault(agent_type, {})
+        else:
+            indexes = self.tables[agent_type].indexes
+        index = indexes.get(name)
+        if index is None:
+            index = indexes[name] = OrderIndex(self.values(agent_type, name))
+        elif index.stale:
+            index.rebuild(self.values(agent_type, name))
+        return index
+
+    def refresh(self, agent_type):
+        """
+        Tell the registry an array-backed population has updated its arrays.
+        """
+        for index in self.population_indexes.get(agent_type, {}).values():
+            index.stale = True
@@ -0,0 +1,117 @@
+import os
+import shutil
+import pandas as pd
+
+from config import OUTPUT_DIR
+
+# Partitioned model run results
+# -----------------------------
+# Each replicate's agent-step DataFrame is written as soon as it finishes, to
+#
+#     <directory>/SimulationID=<id>/part.parquet
+#
+# so nothing has to be held in memory until the end of the ensemble, and a crash keeps the runs
+# that already finished. Parquet needs pyarrow (or fastparquet) installed.
+#
+# The directory is a hive-partitioned dataset: the files leave out the SimulationID column and
+# the directory names supply it, so pd.read_parquet(directory) (or any other parquet reader)
+# opens the whole ensemble at once. iter_runs and load_runs put the column back themselves.
+
+MODEL_RUNS_DIR = os.path.join(OUTPUT_DIR, 'model_runs')
+
+
+def partition_path(directory, simulation_id):
+    return os.path.join(directory, f'SimulationID={simulation_id}', 'part.parquet')
+
+
+def write_partition(directory, simulation_id, df, suffix='.tmp'):
+    """
+    Write one replicate's partition, without its SimulationID column (the directory name has it).
+    Goes to a temporary file (path + suffix) that's renamed into place, so a partition is either
+    complete or missing.
+    """
+    path = partition_path(directory, simulation_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + suffix
+    df.drop(columns='SimulationID', errors='ignore').to_parquet(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+class ResultWriter:
+    """
+    Streams replicate results to disk as they come in. Optionally also appends every replicate to
+    one CSV (e.g. ../output/model_runs.csv, for the tasks downstream that still read it), which
+    never needs more than one replicate in memory either.
+    """
+    def __init__(self, directory=MODEL_RUNS_DIR, csv_path=None):
+        self.directory = directory
+        self.csv_path = csv_path
+        # clear results from previous runs
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.makedirs(directory)
+        if csv_path is not None and os.path.exists(csv_path):
+            os.remove(csv_path)
+        self.csv_header = True
+
+    def write(self, simulation_id, df):
+        write_partition(self.directory, simulation_id, df)
+        if self.csv_path is not None:
+            df.to_csv(self.csv_path, mode='a', header=self.csv_header, index=False)
+            self.csv_header = False
+
+
+def list_runs(directory=MODEL_RUNS_DIR):
+    """
+    SimulationIDs with a complete partition on disk.
+    """
+    if not os.path.isdir(directory):
+        return []
+    simulation_ids = []
+    for name in os.listdir(directory):
+        if name.startswith('SimulationID=') and os.path.exists(os.path.join(directory, name, 'part.parquet')):
+            simulation_ids.append(int(name.split('=', 1)[1]))
+    return sorted(simulation_ids)
+
+
+def iter_runs(directory=MODEL_RUNS_DIR, simulation_ids=None, columns=None):
+    """
+    Lazily yield (simulation_id, DataFrame) one replicate at a time, reading only `columns`.
+    """
+    if simulation_ids is None:
+        simulation_ids = list_runs(directory)
+    # the files don't have SimulationID, it comes from the directory name
+    stored = None if columns is None else [c for c in columns if c != 'SimulationID']
+    for simulation_id in simulation_ids:
+        df = pd.read_parquet(partition_path(directory, simulation_id), columns=stored)
+        if 'SimulationID' not in df:
+            df['SimulationID'] = simulation_id
+        if columns is not None:
+            df = df[list(columns)]
+        yield simulation_id, df
+
+
+def load_runs(directory=MODEL_RUNS_DIR, simulation_ids=None, columns=None):
+    """
+    Load the selected replicates (default all) and columns (default all) into one DataFrame.
+    """
+    frames = [df for _, df in iter_runs(directory, simulation_ids, columns)]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
+
+
+def check_dataset(directory=MODEL_RUNS_DIR):
+    """
+    Open the directory as one parquet dataset, the way other tools will, and check it has every
+    replicate on disk. Raises ValueError if it doesn't.
+    """
+    simulation_ids = list_runs(directory)
+    if not simulation_ids:
+        return simulation_ids
+    df = pd.read_parquet(directory, columns=['SimulationID'])
+    found = sorted(int(i) for i in df['SimulationID'].unique())
+    if found != simulation_ids:
+        raise ValueError(f'{directory} reads as SimulationIDs {found}, expected {simulation_ids}')
+    return simulation_ids
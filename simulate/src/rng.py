@@ -0,0 +1,110 @@
+import bisect
+
+import numpy as np
+
+# Random numbers
+# --------------
+# Every World has one RandomStreams (world.rng), seeded with the World's seed, and every random
+# draw the agents make comes from it, so a seed fully determines a run. Each agent type gets its
+# own child stream (spawned from the seed with np.random.SeedSequence), and ensembles give each
+# replicate its own seed (ensemble.replicate_seeds), so adding agents of one type or another
+# replicate doesn't shift anybody else's draws.
+#
+# The per-agent draws are single values (how many stories to read, is this journalist exposed
+# to propaganda...), and asking numpy for one value at a time costs more than the value is worth.
+# So each stream draws its uniforms in blocks and hands them out one at a time. Array draws (the
+# populations, a scientist's study) go straight to numpy, from a second generator, so the block
+# size never changes the results.
+
+STREAMS = ('World', 'Scientist', 'Journalist', 'Propagandist', 'Citizen', 'Policymaker')
+
+
+class RandomStream:
+    """
+    One agent type's random numbers. Scalar draws come from a buffer of uniforms that's refilled
+    `block` at a time, array draws (size=...) from numpy directly.
+    """
+    def __init__(self, seed_sequence, block=4096):
+        scalars, arrays = seed_sequence.spawn(2)
+        self.scalars = np.random.Generator(np.random.PCG64(scalars))
+        self.generator = np.random.Generator(np.random.PCG64(arrays))
+        self.block = block
+        self._buffer = []
+        self._next = 0
+
+    def _refill(self):
+        self._buffer = self.scalars.random(self.block).tolist()
+        self._next = 0
+
+    def random(self, size=None):
+        """Uniform on [0, 1)."""
+        if size is not None:
+            return self.generator.random(size)
+        if self._next == len(self._buffer):
+            self._refill()
+        u = self._buffer[self._next]
+        self._next += 1
+        return u
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        if size is not None:
+            return self.generator.uniform(low, high, size)
+        return low + (high - low) * self.random()
+
+    def integers(self, low, high, size=None):
+        """Integers in [low, high), like np.random.randint."""
+        if size is not None:
+            return self.generator.integers(low, high, size)
+        return low + int(self.random() * (high - low))
+
+    def bernoulli(self, p, size=None):
+        """True with probability p (an array of 0/1 with `size`)."""
+        if size is not None:
+            return (self.generator.random(size) < p).astype(np.int64)
+        return self.random() < p
+
+    def choice(self, sequence):
+        return sequence[self.integers(0, len(sequence))]
+
+    def sample(self, population, k):
+        """
+        k distinct items of a sequence, in the order they were drawn (like random.sample).
+        """
+        n = len(population)
+        if k > n:
+            raise ValueError('Sample larger than population')
+        chosen, picks = [], []
+        for r in range(k):
+            u = int(self.random() * (n - r))
+            # step over the earlier picks, smallest first, so every unpicked item is equally likely
+            for earlier in chosen:
+                if u >= earlier:
+                    u += 1
+            bisect.insort(chosen, u)
+            picks.append(population[u])
+        return picks
+
+    def beta(self, a, b, size=None):
+        if size is None and np.ndim(a) == 0 and np.ndim(b) == 0:
+            return float(self.generator.beta(a, b))
+        return self.generator.beta(a, b, size)
+
+    def binomial(self, n, p, size=None):
+        return self.generator.binomial(n, p, size)
+
+    def permutation(self, n):
+        return self.generator.permutation(n)
+
+
+class RandomStreams:
+    """
+    The World's random numbers, one RandomStream per agent type (and one for the World itself),
+    all spawned from `seed`: rng['Citizen'].integers(2, 10).
+    """
+    def __init__(self, seed=None, block=4096):
+        self.seed_sequence = np.random.SeedSequence(seed)
+        children = self.seed_sequence.spawn(len(STREAMS))
+        self.streams = {name: RandomStream(child, block) for name, child in zip(STREAMS, children)}
+
+    def __getitem__(self, name):
+        return self.streams[name]
@@ -0,0 +1,165 @@
+import numpy as np
+
+from citizen_population import sample_without_replacement
+
+
+def beta_mean(alpha, beta):
+    """
+    Mean of a Beta(alpha, beta) distribution, what stats.beta(alpha, beta).mean() returns.
+    """
+    return alpha / (alpha + beta)
+
+
+class ScientistPopulation:
+    """
+    Every Bayesian scientist in the model, held as arrays of Beta parameters. Runs the same
+    research -> update -> discuss cycle as BayesianScientist.step, but batched: one binomial draw
+    per scientist for their study, closed-form posterior means, and the credible-peer updates as
+    array operations. BayesianScientist stays the reference implementation this should agree with.
+
+    Random activation is emulated by giving each scientist a random rank every step: peers ranked
+    earlier are seen with the posteriors they ended this step's turn with, peers ranked later with
+    last step's (see interact_with_other_scientists). benchmark.py --agreement checks the two
+    implementations against each other.
+    """
+    agent_type = 'Scientist'
+
+    def __init__(self, num_scientists, model):
+        self.model = model
+        self.rng = model.rng['Scientist']
+        self.n = num_scientists
+        self.unique_id = np.arange(num_scientists, dtype=np.int64) + 10_000_000
+
+        # AGENT PRIORS, PARAMETERS FOR BETA DISTRIBUTION
+        alpha = np.floor(self.rng.uniform(
+            self.model.params['scientist_beta_priors_alpha_low'],
+            self.model.params['scientist_beta_priors_alpha_high'], num_scientists))
+        beta = np.floor(self.rng.uniform(
+            self.model.params['scientist_beta_priors_beta_low'],
+            self.model.params['scientist_beta_priors_beta_high'], num_scientists))
+
+        # All get updated as the model runs (except prior_mean and belief, as in BayesianScientist)
+        self.prior_alpha, self.prior_beta = alpha.copy(), beta.copy()
+        self.prior_mean = beta_mean(alpha, beta)
+        self.posterior_alpha, self.posterior_beta = alpha.copy(), beta.copy()
+        self.posterior_mean = beta_mean(alpha, beta)
+        self.discussed_alpha, self.discussed_beta = alpha.copy(), beta.copy()
+        self.discussed_belief_mean = beta_mean(alpha, beta)
+        self.belief = self.posterior_mean.copy()
+
+        # GENERATE SAMPLE SIZES FOR AGENT RESEARCH
+        sample_size_lower_bound = self.model.params['scientist_study_sample_size_lower_bound']
+        sample_size_upper_bound = self.model.params['scientist_study_sample_size_upper_bound']
+        num_sample_options = sample_size_upper_bound - sample_size_lower_bound
+        sample_sizes = np.linspace(sample_size_lower_bound, sample_size_upper_bound, num_sample_options)
+        self.agent_study_sample_size = sample_sizes[self.rng.integers(0, num_sample_options, num_scientists)].astype(np.int64)
+
+
+    def log_interactions(self, stream, i, j, partner_posterior_mean, step):
+        ij_belief_difference = self.posterior_mean[i] - partner_posterior_mean
+        update = np.abs(ij_belief_difference) < self.model.params['scientist_difference_threshold']
+        self.model.log.write_columns(stream, (
+            self.unique_id[i], self.unique_id[j], ij_belief_difference, update, np.full(len(i), step)
+            ))
+
+    def agents_conduct_own_research(self, true_prob=None):
+        """
+        Likelihood, see BayesianScientist.agent_conducts_own_research. Each scientist's study is
+        a single binomial draw rather than summing `agent_study_sample_size` bernoulli draws.
+        """
+        self.prior_alpha, self.prior_beta = self.discussed_alpha, self.discussed_beta
+        if true_prob:
+            study_prob = true_prob
+        else:
+            study_prob = self.rng.beta(self.prior_alpha, self.prior_beta)
+        self.successes = self.rng.binomial(self.agent_study_sample_size, study_prob)
+        self.failures = self.agent_study_sample_size - self.successes
+
+    def agents_update_beliefs(self):
+        """
+        Posterior Probability: P(H|D) = P(D|H) x P(H) \\ P(D)
+        """
+        self.posterior_alpha = self.prior_alpha + self.successes
+        self.posterior_beta = self.prior_beta + self.failures
+        self.posterior_mean = beta_mean(self.posterior_alpha, self.posterior_beta)
+
+    def interact_with_other_scientists(self, step):
+        """
+        Each scientist talks to 2 to 4 others. Among the credible ones (posterior means closer
+        than the threshold) the last one heard wins, so the new posterior and discussed belief are
+        the scientist's prior plus that peer's posterior.
+        """
+        # SELECT DISCUSSION PARTNERS
+        count, member = self.model.topology.peer_groups(self)
+        k = np.minimum(self.rng.integers(2, 5, self.n), count)
+        picks = sample_without_replacement(count, k, self.rng)
+        partners = np.where(picks >= 0, member(np.arange(self.n)[:, None], np.maximum(picks, 0)), -1)
+
+        # WHO HAS ALREADY TAKEN THEIR TURN THIS STEP
+        # A partner ranked earlier is seen with the posterior they ended their turn with (after
+        # their own discussion), one ranked later with last step's, and a scientist talking to
+        # themselves with their fresh research. So scientists go in waves: everyone whose
+        # earlier-ranked partners have all finished goes next, all at once.
+        rank = self.rng.permutation(self.n)
+        partner = np.maximum(partners, 0)
+        earlier = (partners >= 0) & (rank[partner] < rank[:, None])
+        talks_to_self = (partners >= 0) & (partner == np.arange(self.n)[:, None])
+        research_alpha, research_beta, research_mean = self.posterior_alpha, self.posterior_beta, self.posterior_mean
+        self.posterior_alpha, self.posterior_beta = research_alpha.copy(), research_beta.copy()
+        self.discussed_alpha, self.discussed_beta = self.discussed_alpha.copy(), self.discussed_beta.copy()
+        done = np.zeros(self.n, dtype=bool)
+        waiting = np.arange(self.n)
+        while len(waiting):
+            blocked = (earlier[waiting] & ~done[partner[waiting]]).any(axis=1)
+            turn = waiting[~blocked]
+            waiting = waiting[blocked]
+
+            # ASSESS CREDIBILITY
+            credible_partner = np.full(len(turn), -1)
+            credible_alpha = np.zeros(len(turn))
+            credible_beta = np.zeros(len(turn))
+            for r in range(partners.shape[1]):
+                at = np.flatnonzero(partners[turn, r] >= 0)
+                i = turn[at]
+                j = partners[i, r]
+                seen_alpha = np.where(earlier[i, r], self.posterior_alpha[j], self.last_posterior_alpha[j])
+                seen_beta = np.where(earlier[i, r], self.posterior_beta[j], self.last_posterior_beta[j])
+                seen_alpha = np.where(talks_to_self[i, r], research_alpha[j], seen_alpha)
+                seen_beta = np.where(talks_to_self[i, r], research_beta[j], seen_beta)
+                seen_mean = beta_mean(seen_alpha, seen_beta)
+                # log the interaction metadata, ignoring self loops
+                not_self = i != j
+                self.log_interactions('interactions_scientists', i[not_self], j[not_self], seen_mean[not_self], step)
+                credible = np.abs(research_mean[i] - seen_mean) < self.model.params['scientist_difference_threshold']
+                credible_partner[at[credible]] = j[credible]
+                credible_alpha[at[credible]] = seen_alpha[credible]
+                credible_beta[at[credible]] = seen_beta[credible]
+
+            # UPDATE BELIEFS IF THE SOURCE IS CREDIBLE
+            updated = credible_partner >= 0
+            i = turn[updated]
+            self.posterior_alpha[i] = self.prior_alpha[i] + credible_alpha[updated]
+            self.posterior_beta[i] = self.prior_beta[i] + credible_beta[updated]
+            self.discussed_alpha[i] = self.posterior_alpha[i]
+            self.discussed_beta[i] = self.posterior_beta[i]
+            done[turn] = True
+        self.posterior_mean = beta_mean(self.posterior_alpha, self.posterior_beta)
+        self.discussed_belief_mean = beta_mean(self.discussed_alpha, self.discussed_beta)
+
+    def step(self, step):
+        self.last_posterior_alpha, self.last_posterior_beta = self.posterior_alpha, self.posterior_beta
+        self.agents_conduct_own_research(true_prob=self.model.params['scientist_research_bernoulli_probability'])
+        self.agents_update_beliefs()
+        self.interact_with_other_scientists(step)
+
+    def columns(self):
+        """
+        Current values for the collector, keyed by column name.
+        """
+        return {
+            'Prior': [[a, b] for a, b in zip(self.prior_alpha.astype(int).tolist(), self.prior_beta.astype(int).tolist())],
+            'Prior Mean': self.prior_mean,
+            'Posterior': [[a, b] for a, b in zip(self.posterior_alpha.astype(int).tolist(), self.posterior_beta.astype(int).tolist())],
+            'Posterior Mean': self.posterior_mean,
+            'Belief (After All Step Actions)': self.belief,
+            }
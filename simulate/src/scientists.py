@@ -1,68 +1,62 @@
 import os
-import yaml
-import random 
+from functools import lru_cache
 import numpy as np
-from scipy import stats
-from mesa import Agent
+from registry import IndexedAgent, Tracked
+from scientist_population import beta_mean
 
-# LOAD MODEL PARAMETERS
-with open(r'../input/parameters.yaml') as params:
-    params = yaml.load(params, Loader=yaml.FullLoader)
 
+@lru_cache(maxsize=None)
+def sample_size_options(lower_bound, upper_bound):
+    '''The study sample sizes a scientist can be given (the same for everyone, so worked out once).'''
+    return np.linspace(lower_bound, upper_bound, upper_bound - lower_bound)
 
-class BayesianScientist(Agent):
+
+class BayesianScientist(IndexedAgent):
     """
     Simulated Bayesian scientists, doing research, talking to each other, and updating their beliefs. 
     You know... the grind...
     """
+    __slots__ = (
+        '_posterior_mean', 'prior', 'prior_mean', 'posterior', 'discussed_belief', 'discussed_belief_mean',
+        'agent_study_sample_size', 'successes', 'failures',
+        )
+    agent_type = 'Scientist'
+    posterior_mean = Tracked()
+
     def __init__(self, unique_id, model):
         super().__init__(unique_id+10_000_000, model)
-        self.agent_type = 'Scientist'
-        
-        # SATISFY THE DATA COLLECTOR DURING MODEL RUNS
-        self.story = None
-        self.belief_after_talk = None
-        self.belief_after_talk_media = None
-        self.belief_after_talk_media_propaganda = None
-        self.beliefs_encountered = None
         
         # AGENT PRIORS, PARAMETERS FOR BETA DISTRIBUTION
-        alpha = int(np.random.uniform( 
-            params['scientist_beta_priors_alpha_low'],
-            params['scientist_beta_priors_alpha_high'],1)) 
-        beta = int(np.random.uniform( 
-            params['scientist_beta_priors_beta_low'],
-            params['scientist_beta_priors_beta_high'],1)) 
+        alpha = int(self.rng.uniform( 
+            self.model.params['scientist_beta_priors_alpha_low'],
+            self.model.params['scientist_beta_priors_alpha_high'])) 
+        beta = int(self.rng.uniform( 
+            self.model.params['scientist_beta_priors_beta_low'],
+            self.model.params['scientist_beta_priors_beta_high'])) 
 
-        # All get updated as the model runs
-        self.prior = [alpha, beta]
-        self.prior_mean = stats.beta(*self.prior).mean()
-        self.posterior = [alpha, beta]
-        self.posterior_mean = stats.beta(*self.posterior).mean()
-        self.discussed_belief = [alpha, beta]
-        self.discussed_belief_mean = stats.beta(*self.discussed_belief).mean()
+        # All get updated as the model runs (always replaced, never changed in place, so they can
+        # start out as the same list)
+        self.prior = self.posterior = self.discussed_belief = [alpha, beta]
+        self.prior_mean = self.posterior_mean = self.discussed_belief_mean = beta_mean(alpha, beta)
         # for convienience 
         self.belief = self.posterior_mean
 
         # GENERATE SAMPLE SIZES FOR AGENT RESEARCH
-        sample_size_lower_bound = params['scientist_study_sample_size_lower_bound'] 
-        sample_size_upper_bound = params['scientist_study_sample_size_upper_bound']
-        num_sample_options = sample_size_upper_bound-sample_size_lower_bound
-        sample_sizes = np.linspace(sample_size_lower_bound,sample_size_upper_bound, num_sample_options)
-        self.agent_study_sample_size = int(random.choice(sample_sizes))
+        sample_sizes = sample_size_options(
+            self.model.params['scientist_study_sample_size_lower_bound'],
+            self.model.params['scientist_study_sample_size_upper_bound'])
+        self.agent_study_sample_size = int(self.rng.choice(sample_sizes))
 
-    def log_interaction(self, filename, alter, agent_threshold):
-        with open(filename, 'a') as file:
-            if self.unique_id == alter.unique_id:
-                pass
+    def log_interaction(self, stream, alter, agent_threshold):
+        if self.unique_id == alter.unique_id:
+            pass
+        else:
+            if abs(self.posterior_mean - alter.posterior_mean) < agent_threshold:
+                update = True 
             else:
-                if abs(self.posterior_mean - alter.posterior_mean) < agent_threshold:
-                    update = True 
-                else:
-                    update = False
-                ij_belief_difference = self.posterior_mean - alter.posterior_mean 
-                s = f'{self.unique_id},{alter.unique_id},{ij_belief_difference},{update},{self.model.schedule.steps}\n'
-                file.write(s)
+                update = False
+            ij_belief_difference = self.posterior_mean - alter.posterior_mean 
+            self.model.log.write(stream, (self.unique_id, alter.unique_id, ij_belief_difference, update, self.model.schedule.steps))
     
     # BAYESIAN AGENT CONDUCTS THEIR OWN RESEARCH
     ## Scientists conduct original  research and then update their priors 
@@ -83,9 +77,9 @@ class BayesianScientist(Agent):
         if true_prob:
             study_prob:float = true_prob
         else: 
-            study_prob:float = stats.beta(*self.prior).rvs() # size=1 implicitly
-        self.results:np.ndarray = stats.bernoulli(study_prob).rvs(size=self.agent_study_sample_size)
-        self.successes = self.results.sum()
+            study_prob:float = self.rng.beta(*self.prior)
+        results:np.ndarray = self.rng.bernoulli(study_prob, size=self.agent_study_sample_size)
+        self.successes = results.sum()
         self.failures = self.agent_study_sample_size - self.successes 
 
     def agent_updates_belief(self): 
@@ -96,7 +90,7 @@ class BayesianScientist(Agent):
             self.prior[0] + self.successes, # alpha + successes  
             self.prior[1] + self.failures   # beta + failures
             ]
-        self.posterior_mean = stats.beta(*self.posterior).mean()
+        self.posterior_mean = beta_mean(*self.posterior)
 
     def interacts_with_other_scientists(self): 
         """
@@ -106,21 +100,18 @@ class BayesianScientist(Agent):
         interaction history. It uses the (signed) difference between the two agents as an edge weight.
         """
         # SELECT DISCUSSION PARTNERS
-        peers = []
-        for a in self.model.schedule.agents:
-            if a.agent_type == 'Scientist':
-                peers.append(a)
-        # pick some random number of scientists to talk to, between 2 and 5
-        num_discussion_partners = int(np.random.randint(2,5,1)) 
-        discussion_partners = random.sample(peers, num_discussion_partners)
+        peers = self.model.topology.peers(self)
+        # pick some random number of scientists to talk to, between 2 and 5 (fewer if they don't know that many)
+        num_discussion_partners = min(self.rng.integers(2, 5), len(peers))
+        discussion_partners = self.rng.sample(peers, num_discussion_partners)
         # log the interaction metadata
         for partner in discussion_partners:
-            self.log_interaction(filename='../output/interactions_scientists.csv', alter=partner, agent_threshold=params['scientist_difference_threshold'])
+            self.log_interaction(stream='interactions_scientists', alter=partner, agent_threshold=self.model.params['scientist_difference_threshold'])
 
         # ASSESS CREDIBILITY, UPDATE BELIEFS
         credible_views = []
         for partner in discussion_partners:
-            if abs(self.posterior_mean - partner.posterior_mean) < params['scientist_difference_threshold']:
+            if abs(self.posterior_mean - partner.posterior_mean) < self.model.params['scientist_difference_threshold']:
                 credible_views.append(partner.posterior)
         # UPDATE BELIEFS IF THE SOURCE IS CREDIBLE
         if len(credible_views) > 0:
@@ -132,7 +123,7 @@ class BayesianScientist(Agent):
                     # sum of beta parameters for self prior and peer posterior
                     self.prior[1] + v[1] 
                 ]
-                self.posterior_mean = stats.beta(*self.posterior).mean()
+                self.posterior_mean = beta_mean(*self.posterior)
 
                 # update agent discussed belief and discussed belief mean
                 self.discussed_belief = [
@@ -141,9 +132,9 @@ class BayesianScientist(Agent):
                     # sum of beta parameters for self prior and peer posterior
                     self.prior[1] + v[1] 
                 ]
-                self.discussed_belief_mean = stats.beta(*self.discussed_belief).mean()
+                self.discussed_belief_mean = beta_mean(*self.discussed_belief)
 
     def step(self): 
-        self.agent_conducts_own_research(true_prob=params['scientist_research_bernoulli_probability'])
+        self.agent_conducts_own_research(true_prob=self.model.params['scientist_research_bernoulli_probability'])
         self.agent_updates_belief()
         self.interacts_with_other_scientists()
\ No newline at end of file
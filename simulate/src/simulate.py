@@ -1,43 +1,19 @@
 import os
-import yaml
 import numpy as np
-import pandas as pd
-from model import World
+from ensemble import run_ensemble, profile_path, LOG_DIR
+from results import ResultWriter, check_dataset, MODEL_RUNS_DIR
+from config import load_config, OUTPUT_DIR
+from profiling import combine_reports
+from trajectory import create_store_for, TRAJECTORY_DIR
+from adaptive import AdaptiveEnsemble, write_report
+from aggregates import combine_aggregates, aggregates_path
 from datetime import datetime
 
 now = datetime.now()
 date_time = now.strftime("%B %d (%Y) @ %H:%M:%S")
 
-# Prepare files for interaction logging (including clearing results from previous runs)
-log = ['scientists', 'journalists', 'policymakers', 'citizens', 'propagandists']
-for agent_type in log:
-    file = f'../output/interactions_{agent_type}.csv'
-    try:
-        os.remove(file)
-        with open(file, 'w') as file:
-            if agent_type == 'journalists':
-                file.write('i,j,step\n')
-            else:
-                file.write('i,j,ij_belief_difference,update_boolean,step\n')
-    except:
-        pass
-
-
-# Prepare files for travel logging (including clearing results from previous runs)
-log = ['scientists', 'journalists', 'policymakers', 'citizens', 'propagandists']
-for agent_type in log:
-    file = f'../output/travel_{agent_type}.csv'
-    try:
-        os.remove(file)
-        with open(file, 'w') as file:
-            file.write('agent,x,y,step\n')
-    except:
-        pass
-
-
-# LOAD MODEL PARAMETERS
-with open(r'../input/parameters.yaml') as params:
-    params = yaml.load(params, Loader=yaml.FullLoader)
+# LOAD MODEL PARAMETERS (see config.py)
+params = load_config()
 
 def print_select_model_parameters():
     os.system('clear')
@@ -50,49 +26,100 @@ def print_select_model_parameters():
     print('Number of Scientists:', params['num_scientists'])
     print('Number of Journalists:', params['num_journalists'])
     print('Number of Propagandists:', params['num_propagandists'])
-    print(f'Number of Simulations:', params['number_of_simulations'])
+    if params['ensemble'] == 'adaptive':
+        print(f'Number of Simulations: adaptive, {params["adaptive_min_simulations"]} to {params["adaptive_max_simulations"]}')
+    else:
+        print(f'Number of Simulations:', params['number_of_simulations'])
     print(f'Number of Steps in Each Simulation:', params['steps_per_model'])
+    print('Grid:', params['grid_width'], 'x', params['grid_height'])
     print('\n')
 
-print_select_model_parameters()
-
-# EXECUTE SIMULATIONS
-result_dfs = []
+if __name__ == '__main__':
+    # a fixed base seed makes the whole ensemble reproducible, print it so any run can be repeated
+    seed = params['seed']
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
 
-print('###################')
-print('### SIMULATIONS ###')
-print('###################')
-print('\n')
+    print_select_model_parameters()
+    print('Seed:', seed)
+    print('Workers:', params['workers'])
+    print('\n')
 
-for i in range(params['number_of_simulations']):
-    print('Executing Simulation', i)
-    
-    run = World(
-        num_scientists = params['num_scientists'],
-        num_citizens = params['num_citizens'],
-        num_journalists = params['num_journalists'],
-        num_propagandists = params['num_propagandists'],
-        num_policymakers=params['num_policymakers'],
-        width = 10,
-        height = 10
+    # EXECUTE SIMULATIONS
+    # every replicate goes to disk as soon as it finishes, see results.py for reading them back
+    writer = ResultWriter(
+        MODEL_RUNS_DIR,
+        csv_path = os.path.join(OUTPUT_DIR, 'model_runs.csv') if params['model_runs_csv'] else None
     )
 
-    for j in range(params['steps_per_model']):
-        run.step()
-    
-    agent_beliefs = run.datacollector.get_agent_vars_dataframe().reset_index()
-    agent_beliefs['SimulationID'] = i
-    result_dfs.append(agent_beliefs)
-
-    df = pd.concat(result_dfs)  
-
-print('\n')
-print('################')
-print('### FINISHED ###')
-print('################')
+    # every replicate's beliefs at every step, straight to memory-mapped arrays, see trajectory.py
+    trajectory_dir = None
+    if params['trajectory']:
+        # an adaptive ensemble might need room for as many as adaptive_max_simulations
+        store_params = params
+        if params['ensemble'] == 'adaptive':
+            store_params = params.with_overrides(number_of_simulations=params['adaptive_max_simulations'])
+        create_store_for(store_params, TRAJECTORY_DIR)
+        trajectory_dir = TRAJECTORY_DIR
+        print('Trajectories:', TRAJECTORY_DIR, '\n')
+
+    print('###################')
+    print('### SIMULATIONS ###')
+    print('###################')
+    print('\n')
 
-# print('\n')
-# print(df.info())
+    # each replicate runs in its own worker process and writes its own logs to ../output/logs/simulation_<id>
+    adaptive = None
+    if params['ensemble'] == 'adaptive':
+        # batches of replicates until the outcomes' confidence intervals are narrow enough, see adaptive.py
+        adaptive = AdaptiveEnsemble(params)
+        replicates = adaptive.run(
+            seed = seed,
+            workers = params['workers'],
+            chunksize = params['chunksize'],
+            log_dir = LOG_DIR,
+            trajectory_dir = trajectory_dir
+        )
+    else:
+        replicates = run_ensemble(
+            params,
+            params['number_of_simulations'],
+            seed = seed,
+            workers = params['workers'],
+            chunksize = params['chunksize'],
+            log_dir = LOG_DIR,
+            trajectory_dir = trajectory_dir
+        )
+    finished = []
+    for i, agent_beliefs in replicates:
+        print('Finished Simulation', i)
+        # nothing to write when only the aggregates are collected
+        if params['collect_agents']:
+            writer.write(i, agent_beliefs)
+        finished.append(i)
+    # the partitions should open as one dataset (pd.read_parquet(MODEL_RUNS_DIR)), see results.py
+    if params['collect_agents']:
+        check_dataset(MODEL_RUNS_DIR)
+
+    # how many replicates it took, and how well each outcome is pinned down
+    if adaptive is not None:
+        report = adaptive.report()
+        print('\n')
+        print(report.to_string(index=False))
+        print('Replicates needed:', len(finished))
+        print('Report:', write_report(adaptive, OUTPUT_DIR))
+
+    # per-step, per-type summaries, for each replicate and for the whole ensemble
+    if params['aggregates']:
+        paths = {i: aggregates_path(LOG_DIR, i) for i in finished}
+        print('Aggregates:', *combine_aggregates(paths, params['aggregate_thresholds'], OUTPUT_DIR))
+
+    # one profile report for the whole run, next to model_runs.csv
+    if params['profile']:
+        profiles = {i: profile_path(LOG_DIR, i) for i in finished}
+        print('Profile:', combine_reports(profiles, os.path.join(OUTPUT_DIR, 'profile.csv')))
 
-# STORE RESULTS
-df.to_csv('../output/model_runs.csv', index=False)
\ No newline at end of file
+    print('\n')
+    print('################')
+    print('### FINISHED ###')
+    print('################')
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import yaml
+from scipy.stats import qmc
+
+from config import load_config, OUTPUT_DIR
+from ensemble import run_replicate, replicate_seeds
+
+# Parameter sweeps
+# ----------------
+# A sweep spec (yaml) says which parameters to vary, how to sample them and how many replicates
+# to run at each point:
+#
+#     design: lhs              # grid, lhs (Latin hypercube) or sobol
+#     samples: 32              # points for lhs / sobol
+#     replicates: 5
+#     seed: 1
+#     parameters:
+#       citizen_difference_threshold: [0.1, 0.2, 0.3]             # these values
+#       journalist_risk_of_exposure_to_propaganda: {low: 0.1, high: 0.6, num: 6}  # a range
+#       scientist_beta_priors_alpha_high: {low: 2, high: 20, integer: true}
+#       scientist_beta_priors_beta_high: {low: 2, high: 200, log: true, integer: true}
+#
+# A grid design takes every combination of the values (ranges become `num` evenly spaced values).
+# lhs and sobol draw `samples` points from the ranges (and pick from the value lists).
+#
+# Every run (one point, one replicate) is cached under a hash of its full parameter set, its seed
+# and the model's source code, in output/sweeps/cache, so re-running a sweep only computes the
+# points that aren't there yet and editing the model invalidates the lot. That only works with a
+# fixed seed: the spec's `seed`, or else `seed` in parameters.yaml. A sweep with neither is
+# refused, since fresh seeds would make every run (and every lhs / sobol point) new each time.
+# Replicate r gets the same seed at every point. Sobol points are a fixed sequence, so raising `samples` keeps the
+# points already run, while a Latin hypercube with a different number of samples is all new points.
+
+SWEEPS_DIR = os.path.join(OUTPUT_DIR, 'sweeps')
+CACHE_DIR = os.path.join(SWEEPS_DIR, 'cache')
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+# drivers that don't change what a run computes
+DRIVERS = {'simulate.py', 'sweep.py', 'benchmark.py', 'adaptive.py', 'workqueue.py'}
+# parameters that only say how runs are executed, not what they compute
+EXECUTION_KEYS = {
+    'seed', 'number_of_simulations', 'workers', 'chunksize', 'threads', 'rng_block', 'model_runs_csv', 'profile',
+    'trajectory', 'trajectory_dtype', 'ensemble', 'adaptive_outcomes', 'adaptive_target_width',
+    'adaptive_confidence', 'adaptive_batch', 'adaptive_min_simulations', 'adaptive_max_simulations',
+    }
+
+
+def code_version(source_dir=SOURCE_DIR):
+    """
+    Hash of the model's source files.
+    """
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(source_dir)):
+        if name.endswith('.py') and name not in DRIVERS:
+            digest.update(name.encode())
+            with open(os.path.join(source_dir, name), 'rb') as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+def run_key(params, seed, version):
+    """
+    Content address of one run.
+    """
+    values = {key: value for key, value in params.items() if key not in EXECUTION_KEYS}
+    blob = json.dumps({'params': values, 'seed': seed, 'code': version}, sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _levels(spec):
+    """
+    The values a parameter takes in a grid design.
+    """
+    if isinstance(spec, list):
+        return spec
+    if spec.get('log'):
+        values = np.geomspace(spec['low'], spec['high'], spec.get('num', 3))
+    else:
+        values = np.linspace(spec['low'], spec['high'], spec.get('num', 3))
+    return [int(round(v)) for v in values] if spec.get('integer') else values.tolist()
+
+
+def _from_unit(spec, u):
+    """
+    Map draws u in [0, 1) onto a parameter's range (or list of values).
+    """
+    if isinstance(spec, list):
+        return [spec[int(k)] for k in np.minimum(np.floor(u * len(spec)), len(spec) - 1)]
+    low, high = spec['low'], spec['high']
+    if spec.get('integer'):
+        # every integer in [low, high] gets an equal slice of [0, 1)
+        if spec.get('log'):
+            values = np.floor(np.exp(np.log(low) + u * (np.log(high + 1) - np.log(low))))
+        else:
+            values = np.floor(low + u * (high + 1 - low))
+        return [int(min(v, high)) for v in values]
+    if spec.get('log'):
+        return np.exp(np.log(low) + u * (np.log(high) - np.log(low))).tolist()
+    return (low + u * (high - low)).tolist()
+
+
+def sweep_seed(spec, params):
+    """
+    The seed a sweep's points and replicates are drawn from: the spec's, or else the parameters'.
+    """
+    seed = spec.get('seed')
+    if seed is None:
+        seed = params['seed']
+    if seed is None:
+        raise ValueError('A sweep needs a seed for its runs to be cached: set `seed` in the spec or in parameters.yaml')
+    return seed
+
+
+def design_points(spec, seed):
+    """
+    The sweep's points, as a list of {parameter: value} overrides (lhs and sobol drawn from `seed`).
+    """
+    parameters = spec['parameters']
+    names = list(parameters)
+    design = spec.get('design', 'grid')
+    if design == 'grid':
+        return [dict(zip(names, values)) for values in itertools.product(*(_levels(parameters[n]) for n in names))]
+    samples = spec['samples']
+    if design == 'lhs':
+        unit = qmc.LatinHypercube(d=len(names), seed=seed).random(samples)
+    elif design == 'sobol':
+        unit = qmc.Sobol(d=len(names), scramble=True, seed=seed).random(samples)
+    else:
+        raise ValueError(f"Unknown design '{design}', expected 'grid', 'lhs' or 'sobol'")
+    columns = [_from_unit(parameters[n], unit[:, k]) for k, n in enumerate(names)]
+    return [dict(zip(names, values)) for values in zip(*columns)]
+
+
+def entry_dir(key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, key[:2], key)
+
+
+def is_cached(key, cache_dir=CACHE_DIR):
+    return os.path.exists(os.path.join(entry_dir(key, cache_dir), 'run.json'))
+
+
+def run_point(key, params, seed, replicate, cache_dir=CACHE_DIR):
+    """
+    Run one point/replicate and store it in the cache. run.json goes in last, so an entry either
+    has it and is complete, or is ignored and recomputed.
+    """
+    entry = entry_dir(key, cache_dir)
+    tmp = f'{entry}.{os.getpid()}.tmp'
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    os.makedirs(tmp)
+    _, agent_beliefs = run_replicate(replicate, seed, params, log_dir=os.path.join(tmp, 'logs'))
+    agent_beliefs.to_parquet(os.path.join(tmp, 'part.parquet'), index=False)
+    with open(os.path.join(tmp, 'run.json'), 'w') as file:
+        json.dump({'params': dict(params), 'seed': seed, 'replicate': replicate}, file, default=str)
+    if os.path.isdir(entry):
+        shutil.rmtree(entry)
+    os.replace(tmp, entry)
+    return key
+
+
+def plan_sweep(spec, params=None, cache_dir=CACHE_DIR):
+    """
+    The sweep's index, one row per run with its point, replicate, seed, cache key and parameter
+    values, and the runs still to compute as {key: (params, seed, replicate)}.
+    """
+    params = params if params is not None else load_config()
+    seed = sweep_seed(spec, params)
+    version = code_version()
+    seeds = replicate_seeds(seed, spec.get('replicates', 1))
+    rows, pending = [], {}
+    for point_id, point in enumerate(design_points(spec, seed)):
+        point_params = params.with_overrides(**point)
+        for replicate, seed in enumerate(seeds):
+            key = run_key(point_params, seed, version)
+            rows.append({'point': point_id, 'replicate': replicate, 'seed': seed, 'key': key, **point})
+            if not is_cached(key, cache_dir) and key not in pending:
+                pending[key] = (point_params, seed, replicate)
+    index = pd.DataFrame(rows)
+    index['cached'] = ~index['key'].isin(list(pending))
+    return index, pending
+
+
+def run_sweep(spec, params=None, workers=1, cache_dir=CACHE_DIR):
+    """
+    Run every point and replicate of a sweep that isn't cached yet. Returns the sweep's index
+    (see plan_sweep).
+    """
+    index, pending = plan_sweep(spec, params, cache_dir)
+    print(f'{len(index)} runs, {len(index) - len(pending)} cached, {len(pending)} to compute')
+    if workers == 1:
+        for key, (point_params, seed, replicate) in pending.items():
+            run_point(key, point_params, seed, replicate, cache_dir)
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(run_point, key, point_params, seed, replicate, cache_dir)
+                for key, (point_params, seed, replicate) in pending.items()
+                ]
+            for done, future in enumerate(as_completed(futures), 1):
+                future.result()
+                print(f'{done}/{len(futures)} runs done')
+    return index
+
+
+def load_sweep(index, columns=None, cache_dir=CACHE_DIR):
+    """
+    Every run in a sweep index in one DataFrame, with the point, replicate and swept parameter
+    values as columns.
+    """
+    swept = [c for c in index.columns if c not in ('seed', 'key', 'cached')]
+    frames = []
+    for row in index.itertuples(index=False):
+        df = pd.read_parquet(os.path.join(entry_dir(row.key, cache_dir), 'part.parquet'), columns=columns)
+        for name in swept:
+            df[name] = getattr(row, name)
+        frames.append(df)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a parameter sweep, reusing cached runs.')
+    parser.add_argument('spec', help='sweep spec (yaml)')
+    parser.add_argument('--name', help='sweep name, the index goes to output/sweeps/<name>/index.csv (default: spec file name)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: workers from parameters.yaml)')
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as file:
+        spec = yaml.safe_load(file)
+    params = load_config()
+    try:
+        index = run_sweep(spec, params, workers=args.workers or params['workers'])
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    name = args.name or os.path.splitext(os.path.basename(args.spec))[0]
+    os.makedirs(os.path.join(SWEEPS_DIR, name), exist_ok=True)
+    path = os.path.join(SWEEPS_DIR, name, 'index.csv')
+    index.to_csv(path, index=False)
+    print('Index:', path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
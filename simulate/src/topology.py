@@ -0,0 +1,210 @@
+import os
+
+import numpy as np
+
+# Topologies
+# ----------
+# Who an agent can pick its discussion partners from. The default, `topology: grid`, is the
+# model as it always was: citizens talk to whoever shares their grid cell, scientists and
+# policymakers to anyone of their own type.
+#
+# The other topologies put citizens, scientists and policymakers on a social network instead,
+# one undirected graph per type, and partners are sampled from an agent's neighbours:
+#
+#   small_world   Watts-Strogatz: a ring where everyone knows their `topology_degree` nearest
+#                 neighbours, with each tie rewired to someone random with `topology_rewiring`
+#   scale_free    Chung-Lu: power-law expected degrees (exponent `topology_exponent`) averaging
+#                 `topology_degree`
+#   file          a network built by get_interaction_network from an earlier run's logs
+#                 (`topology_path` is its output for one simulation, e.g. .../simulation_0)
+#
+# Node k of a type's graph is that type's k-th agent (the k-th row in the registry, the k-th
+# element of a population's arrays). A network peer group is the agent and its neighbours, just
+# as a grid cell's citizens include the one asking, so the rules for how many partners to pick
+# don't change. Citizens still move around the grid (and log their travel) either way.
+#
+# Graphs are CSR arrays (int64 indptr, int32 indices below 2^31 nodes), about 8 bytes per edge,
+# built with array operations only, so millions of nodes and tens of millions of edges are fine.
+
+TOPOLOGIES = ('grid', 'small_world', 'scale_free', 'file')
+# the types that pick discussion partners, and their networks in get_interaction_network's output
+NETWORK_TYPES = {'Scientist': 'scientists', 'Citizen': 'citizens', 'Policymaker': 'policymakers'}
+# agent type -> first unique_id, see the agents' __init__
+ID_OFFSETS = {'Scientist': 10_000_000, 'Citizen': 40_000_000, 'Policymaker': 50_000_000}
+# edges drawn per batch when generating graphs, bounds the temporary arrays
+CHUNK_EDGES = 1 << 22
+
+
+def node_dtype(n):
+    return np.int32 if n < 2**31 else np.int64
+
+
+class CSRGraph:
+    """
+    An undirected graph on nodes 0..n-1 as CSR arrays: node i's neighbours are
+    indices[indptr[i]:indptr[i + 1]], sorted.
+    """
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+        self.n = len(indptr) - 1
+
+    @classmethod
+    def from_edges(cls, n, u, v):
+        """
+        The graph with edges (u[k], v[k]) in both directions, without self loops or repeats.
+        """
+        keep = u != v
+        u, v = u[keep].astype(np.int64), v[keep].astype(np.int64)
+        keys = np.unique(np.concatenate([u * n + v, v * n + u]))
+        del u, v
+        rows = keys // n
+        indices = (keys - rows * n).astype(node_dtype(n))
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+        return cls(indptr, indices)
+
+    def degree(self):
+        return np.diff(self.indptr)
+
+    def neighbours(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def edges(self):
+        return len(self.indices) // 2
+
+    def member(self, i, p):
+        """
+        Member p of each node i's peer group (p = 0 is i itself, p = 1.. its neighbours).
+        """
+        i, p = np.broadcast_arrays(i, p)
+        out = i.astype(np.int64)
+        neighbour = p > 0
+        out[neighbour] = self.indices[self.indptr[i[neighbour]] + p[neighbour] - 1]
+        return out
+
+
+def small_world(n, degree, rewiring, rng):
+    """
+    Watts-Strogatz graph: a ring lattice with `degree` neighbours each (rounded down to even),
+    every tie rewired to a random node with probability `rewiring`.
+    """
+    half = min(degree // 2, max((n - 1) // 2, 0))
+    dtype = node_dtype(n)
+    us, vs = [], []
+    for start in range(0, n * half, CHUNK_EDGES):
+        tie = np.arange(start, min(start + CHUNK_EDGES, n * half))
+        u = (tie // half).astype(dtype)
+        v = ((u.astype(np.int64) + tie % half + 1) % n).astype(dtype)
+        rewired = rng.random(len(tie)) < rewiring
+        v[rewired] = rng.integers(0, n, rewired.sum())
+        us.append(u)
+        vs.append(v)
+    if not us:
+        return CSRGraph.from_edges(n, np.empty(0, dtype), np.empty(0, dtype))
+    return CSRGraph.from_edges(n, np.concatenate(us), np.concatenate(vs))
+
+
+def scale_free(n, degree, exponent, rng):
+    """
+    Chung-Lu graph with power-law expected degrees, P(degree = d) ~ d^-exponent, averaging
+    `degree`: n * degree / 2 edges, each joining two nodes drawn in proportion to their weights.
+    """
+    weights = np.arange(1, n + 1, dtype=float) ** (-1 / (exponent - 1))
+    cumulative = np.cumsum(weights)
+    cumulative /= cumulative[-1]
+    m = n * degree // 2
+    dtype = node_dtype(n)
+    us, vs = [], []
+    for start in range(0, m, CHUNK_EDGES):
+        size = min(CHUNK_EDGES, m - start)
+        us.append(np.minimum(np.searchsorted(cumulative, rng.random(size), 'right'), n - 1).astype(dtype))
+        vs.append(np.minimum(np.searchsorted(cumulative, rng.random(size), 'right'), n - 1).astype(dtype))
+    if not us:
+        return CSRGraph.from_edges(n, np.empty(0, dtype), np.empty(0, dtype))
+    return CSRGraph.from_edges(n, np.concatenate(us), np.concatenate(vs))
+
+
+def load_graph(directory, agent_type, n):
+    """
+    One type's network from get_interaction_network's output (nodes.npy and <type>/indptr.npy,
+    indices.npy), restricted to that type's first n agents. Only those agents' rows are read.
+    """
+    nodes = np.load(os.path.join(directory, 'nodes.npy'), mmap_mode='r')
+    path = os.path.join(directory, NETWORK_TYPES[agent_type])
+    indptr = np.load(os.path.join(path, 'indptr.npy'), mmap_mode='r')
+    indices = np.load(os.path.join(path, 'indices.npy'), mmap_mode='r')
+    offset = ID_OFFSETS[agent_type]
+    lo, hi = np.searchsorted(nodes, [offset, offset + n])
+    u = np.repeat(np.asarray(nodes[lo:hi]) - offset, np.diff(indptr[lo:hi + 1]))
+    v = np.asarray(nodes)[indices[indptr[lo]:indptr[hi]]] - offset
+    keep = (v >= 0) & (v < n)
+    return CSRGraph.from_edges(n, u[keep], v[keep])
+
+
+class GridTopology:
+    """
+    Citizens talk to their cellmates, scientists and policymakers to anyone of their type.
+    """
+    name = 'grid'
+
+    def peers(self, agent):
+        """
+        The agents `agent` can pick discussion partners from (itself included).
+        """
+        if agent.agent_type == 'Citizen':
+            return agent.model.grid.cellmates(agent.pos, 'Citizen')
+        return agent.model.registry.agents(agent.agent_type)
+
+    def peer_groups(self, population):
+        """
+        Everyone's peer group in an array-backed population, as (count, member): count[i] is
+        the size of i's group (itself included) and member(i, p) is the p-th of them.
+        """
+        if population.agent_type == 'Citizen':
+            order, start, count = population.grid.co_located(population.x, population.y)
+            return count, lambda i, p: order[start[i] + p]
+        return np.full(population.n, population.n), lambda i, p: np.broadcast_arrays(i, p)[1]
+
+
+class NetworkTopology(GridTopology):
+    """
+    Agents of the types in `graphs` (agent type -> CSRGraph) talk to their neighbours, the
+    rest as on the grid.
+    """
+    name = 'network'
+
+    def __init__(self, graphs):
+        self.graphs = graphs
+
+    def peers(self, agent):
+        graph = self.graphs.get(agent.agent_type)
+        if graph is None:
+            return super().peers(agent)
+        agents = agent.model.registry.agents(agent.agent_type)
+        return [agent] + [agents[j] for j in graph.neighbours(agent._registry_row)]
+
+    def peer_groups(self, population):
+        graph = self.graphs.get(population.agent_type)
+        if graph is None:
+            return super().peer_groups(population)
+        return graph.degree() + 1, graph.member
+
+
+def make_topology(params, sizes, rng):
+    """
+    The topology `params` asks for, with a graph for each type in `sizes` (agent type ->
+    number of agents) drawn from `rng` (a rng.RandomStream).
+    """
+    kind = params['topology']
+    if kind == 'grid':
+        return GridTopology()
+    graphs = {}
+    for agent_type, n in sizes.items():
+        if kind == 'small_world':
+            graphs[agent_type] = small_world(n, params['topology_degree'], params['topology_rewiring'], rng)
+        elif kind == 'scale_free':
+            graphs[agent_type] = scale_free(n, params['topology_degree'], params['topology_exponent'], rng)
+        else:
+            graphs[agent_type] = load_graph(params['topology_path'], agent_type, n)
+    return NetworkTopology(graphs)
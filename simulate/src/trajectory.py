@@ -0,0 +1,160 @@
+import os
+import json
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from config import OUTPUT_DIR
+
+# Trajectory store
+# ----------------
+# With `trajectory: true` every agent's beliefs at every step go straight from World.step into
+# preallocated memory-mapped arrays on disk, one .npy per field, laid out replicate x step x agent:
+#
+#     <directory>/
+#         meta.json                  replicates, steps, dtype, and each agent type's slice of the
+#                                    agent axis ([start, stop), types in TYPES order)
+#         agent_id.npy               unique_id of every agent along the agent axis
+#         belief.npy                 (replicates, steps, agents), one per stage in FIELDS
+#         belief_after_talk.npy      ...
+#         posterior_mean.npy         (replicates, steps, scientists)
+#
+# Step s holds the state at the start of step s, what the collector sees. Stages an agent type
+# doesn't have are NaN. Each replicate writes its own slice, so ensemble workers share the files.
+#
+# open_trajectories() maps them read-only, so slicing a step, a type or a replicate only reads
+# those pages:
+#
+#     store = open_trajectories()
+#     store.field('belief', agent_type='Citizen', step=10)    # (replicates, citizens)
+#
+# The DataCollector still runs alongside; at scale thin it out with collect_every / collect_sample.
+
+TRAJECTORY_DIR = os.path.join(OUTPUT_DIR, 'trajectory')
+TYPES = ('Scientist', 'Journalist', 'Propagandist', 'Citizen', 'Policymaker')
+COUNT_KEYS = {
+    'Scientist': 'num_scientists', 'Journalist': 'num_journalists', 'Propagandist': 'num_propagandists',
+    'Citizen': 'num_citizens', 'Policymaker': 'num_policymakers',
+    }
+FIELDS = ('belief', 'belief_after_talk', 'belief_after_talk_media', 'belief_after_talk_media_propaganda')
+SCIENTIST_FIELDS = ('posterior_mean',)
+
+
+def create_store(directory, replicates, steps, counts, dtype='float32'):
+    """
+    Preallocate the store for `replicates` runs of `steps` steps, with counts[agent_type] agents
+    of each type. Everything starts out NaN. Returns the metadata.
+    """
+    os.makedirs(directory, exist_ok=True)
+    slices, start = {}, 0
+    for agent_type in TYPES:
+        slices[agent_type] = [start, start + counts.get(agent_type, 0)]
+        start += counts.get(agent_type, 0)
+    meta = {'replicates': replicates, 'steps': steps, 'agents': start, 'dtype': dtype, 'types': slices}
+    agent_id = open_memmap(os.path.join(directory, 'agent_id.npy'), mode='w+', dtype=np.int64, shape=(start,))
+    agent_id[:] = -1
+    agent_id.flush()
+    for name in FIELDS:
+        array = open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+', dtype=dtype, shape=(replicates, steps, start))
+        array[:] = np.nan
+        array.flush()
+    scientists = counts.get('Scientist', 0)
+    for name in SCIENTIST_FIELDS:
+        array = open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+', dtype=dtype, shape=(replicates, steps, scientists))
+        array[:] = np.nan
+        array.flush()
+    with open(os.path.join(directory, 'meta.json'), 'w') as file:
+        json.dump(meta, file, indent=2)
+    return meta
+
+
+def create_store_for(params, directory=TRAJECTORY_DIR):
+    """
+    create_store() sized for an ensemble run with `params`.
+    """
+    counts = {agent_type: params[key] for agent_type, key in COUNT_KEYS.items()}
+    return create_store(
+        directory, params['number_of_simulations'], params['steps_per_model'], counts, params['trajectory_dtype']
+        )
+
+
+class Trajectories:
+    """
+    A trajectory store on disk, every field memory-mapped (read-only by default).
+    """
+    def __init__(self, directory=TRAJECTORY_DIR, mode='r'):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as file:
+            self.meta = json.load(file)
+        self.agent_id = np.load(os.path.join(directory, 'agent_id.npy'), mmap_mode=mode)
+        self.arrays = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode=mode)
+            for name in FIELDS + SCIENTIST_FIELDS
+            }
+
+    def slice(self, agent_type):
+        start, stop = self.meta['types'][agent_type]
+        return slice(start, stop)
+
+    def unique_ids(self, agent_type):
+        return self.agent_id[self.slice(agent_type)]
+
+    def field(self, name, agent_type=None, step=None, replicate=None):
+        """
+        A view of one field, indexed (replicate, step, agent), narrowed to an agent type, a step
+        and/or a replicate. Nothing is read until the view is.
+        """
+        array = self.arrays[name]
+        agents = slice(None)
+        if agent_type is not None and name not in SCIENTIST_FIELDS:
+            agents = self.slice(agent_type)
+        replicates = slice(None) if replicate is None else replicate
+        steps = slice(None) if step is None else step
+        return array[replicates, steps, agents]
+
+
+def open_trajectories(directory=TRAJECTORY_DIR):
+    return Trajectories(directory)
+
+
+class TrajectoryWriter:
+    """
+    Writes one replicate's rows of a store, see World.step.
+    """
+    def __init__(self, directory, replicate):
+        self.store = Trajectories(directory, mode='r+')
+        self.replicate = replicate
+        self.ids_written = False
+
+    def write(self, model, step):
+        arrays = self.store.arrays
+        if step >= self.store.meta['steps']:
+            raise IndexError(f"The trajectory store holds {self.store.meta['steps']} steps, can't write step {step}")
+        for agent_type in TYPES:
+            agents = self.store.slice(agent_type)
+            if agents.stop == agents.start:
+                continue
+            if not self.ids_written:
+                self.store.agent_id[agents] = model.registry.unique_ids(agent_type)
+            names = FIELDS + SCIENTIST_FIELDS if agent_type == 'Scientist' else FIELDS
+            for name in names:
+                values = _values(model.registry, agent_type, name)
+                if values is None:
+                    continue
+                target = slice(None) if name in SCIENTIST_FIELDS else agents
+                arrays[name][self.replicate, step, target] = values
+        self.ids_written = True
+
+    def flush(self):
+        self.store.agent_id.flush()
+        for array in self.store.arrays.values():
+            array.flush()
+
+
+def _values(registry, agent_type, name):
+    """
+    One type's values of a tracked attribute, None if the type doesn't have it.
+    """
+    if agent_type in registry.populations and not hasattr(registry.populations[agent_type], name):
+        return None
+    return registry.values(agent_type, name)
@@ -0,0 +1,391 @@
+import os
+import sys
+import time
+import uuid
+import pickle
+import shutil
+import socket
+import sqlite3
+import argparse
+import threading
+import traceback
+import multiprocessing
+
+import numpy as np
+import yaml
+
+from config import load_config, OUTPUT_DIR
+from ensemble import run_replicate, replicate_seeds, LOG_DIR
+from results import write_partition, MODEL_RUNS_DIR
+from sweep import plan_sweep, run_point, CACHE_DIR
+
+# Work queue
+# ----------
+# Runs replicates on as many machines as can see the same directory. A coordinator puts jobs in
+# a SQLite database (output/queue/jobs.sqlite by default), and any number of workers, on any
+# host, claim them one at a time, run them and mark them done:
+#
+#     python workqueue.py submit                    # the ensemble in parameters.yaml
+#     python workqueue.py submit --sweep spec.yaml  # every uncached run of a sweep
+#     python workqueue.py work --processes 4        # on each machine, as many as you like
+#     python workqueue.py status
+#
+# A job is a replicate (written to output/model_runs/SimulationID=<id>, like simulate.py) or a
+# sweep run (written to the sweep cache, see sweep.py). Submitting the same ensemble or sweep twice
+# doesn't add anything already queued. A sweep run's key says what it computes. A replicate's key
+# is where it writes (results directory and SimulationID), and submitting a replicate that's
+# already queued with a different seed or parameters is refused, since both would write the same
+# partition and logs. So an ensemble submitted without a `seed` (a fresh one every time) can't be
+# submitted again into the same results directory: set `seed` in parameters.yaml to resubmit.
+#
+# A claim is a lease: the worker renews it every `lease` / 3 seconds while the job runs. If a
+# worker dies its lease runs out and the next worker to come along takes the job over. A job
+# that raises goes back in the queue too, until it has been tried `max_attempts` times, then it's
+# marked failed with the traceback. Results are written to a temporary path and renamed into
+# place, and a replicate computes the same thing every time, so a job that runs twice (a slow
+# worker losing its lease) just writes the same files twice.
+#
+# SQLite needs working file locks, so on a cluster put the database on a filesystem that has
+# them (most local and modern network filesystems do; old NFS setups don't). Leases are wall
+# clock times, so the hosts' clocks should agree to well within a lease.
+
+QUEUE_DIR = os.path.join(OUTPUT_DIR, 'queue')
+QUEUE_PATH = os.path.join(QUEUE_DIR, 'jobs.sqlite')
+STATUSES = ('pending', 'running', 'done', 'failed')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    key TEXT UNIQUE NOT NULL,
+    payload BLOB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    error TEXT,
+    submitted REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_until);
+'''
+
+
+def run_simulation(simulation_id, seed, params, results_dir=MODEL_RUNS_DIR, log_dir=LOG_DIR):
+    """
+    One replicate of an ensemble, written to its partition in `results_dir` and its logs to
+    log_dir/simulation_<id>. Logs go to a temporary directory first, so a half-finished attempt
+    never leaves its logs mixed up with a finished one's.
+    """
+    tmp = os.path.join(log_dir, f'.simulation_{simulation_id}.{socket.gethostname()}.{os.getpid()}.tmp')
+    if os.path.isdir(tmp):
+        shutil.rmtree(tmp)
+    _, agent_beliefs = run_replicate(simulation_id, seed, params, log_dir=tmp)
+    path = write_partition(results_dir, simulation_id, agent_beliefs, suffix=f'.{socket.gethostname()}.{os.getpid()}.tmp')
+    logs = os.path.join(log_dir, f'simulation_{simulation_id}')
+    if os.path.isdir(logs):
+        shutil.rmtree(logs)
+    os.replace(os.path.join(tmp, f'simulation_{simulation_id}'), logs)
+    shutil.rmtree(tmp)
+    return path
+
+
+class WorkQueue:
+    """
+    The jobs table in a SQLite database, see above. Every method is its own transaction, so
+    any number of processes can share one.
+    """
+    def __init__(self, path=QUEUE_PATH, max_attempts=3):
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # autocommit, transactions are started explicitly where they're needed
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def submit(self, key, function, *args):
+        """
+        Queue function(*args) under `key`, unless a job with that key is already there.
+        True if it was added.
+        """
+        payload = pickle.dumps((function, args), protocol=pickle.HIGHEST_PROTOCOL)
+        cursor = self.connection.execute(
+            'INSERT OR IGNORE INTO jobs (key, payload, max_attempts, submitted) VALUES (?, ?, ?, ?)',
+            (key, payload, self.max_attempts, time.time())
+            )
+        return cursor.rowcount == 1
+
+    def submit_all(self, jobs, same=None):
+        """
+        Queue (key, function, args) for every job in one transaction, skipping keys already there.
+        With `same`, a key that's queued with other arguments (same(queued_args, args) False) is a
+        conflict: nothing gets queued and it raises ValueError. Returns how many were added.
+        """
+        added = 0
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            conflicts = []
+            for key, function, args in jobs:
+                row = self.connection.execute('SELECT payload FROM jobs WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    if same is not None and not same(pickle.loads(row[0])[1], args):
+                        conflicts.append(key)
+                    continue
+                added += self.submit(key, function, *args)
+            if conflicts:
+                raise ValueError(f'{len(conflicts)} jobs are already queued with different arguments, e.g. {conflicts[0]}')
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        return added
+
+    def claim(self, worker, lease=60):
+        """
+        Take the oldest job that's pending, or running on a lease that ran out. Returns
+        (job_id, function, args), or None if there's nothing to do right now.
+        """
+        now = time.time()
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute(
+                """SELECT id, payload FROM jobs
+                   WHERE (status = 'pending' OR (status = 'running' AND lease_until < ?))
+                   AND attempts < max_attempts
+                   ORDER BY id LIMIT 1""",
+                (now,)
+                ).fetchone()
+            if row is not None:
+                self.connection.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_until = ? WHERE id = ?",
+                    (worker, now + lease, row[0])
+                    )
+            # jobs whose last lease ran out on their last attempt
+            self.connection.execute(
+                """UPDATE jobs SET status = 'failed', error = 'lease expired', finished = ?
+                   WHERE status = 'running' AND lease_until < ? AND attempts >= max_attempts""",
+                (now, now)
+                )
+            self.connection.execute('COMMIT')
+        except BaseException:
+            self.connection.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        function, args = pickle.loads(row[1])
+        return row[0], function, args
+
+    def renew(self, job_id, worker, lease=60):
+        """
+        Extend `worker`'s lease on a job. False if it isn't the worker's any more.
+        """
+        cursor = self.connection.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + lease, job_id, worker)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, worker):
+        self.connection.execute(
+            "UPDATE jobs SET status = 'done', error = NULL, finished = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time(), job_id, worker)
+            )
+
+    def fail(self, job_id, worker, error):
+        """
+        Give a job back after an error: pending again if it has attempts left, failed if not.
+        """
+        self.connection.execute(
+            """UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END,
+               error = ?, lease_until = NULL, finished = ? WHERE id = ? AND worker = ? AND status = 'running'""",
+            (error, time.time(), job_id, worker)
+            )
+
+    def retry_failed(self):
+        """
+        Put every failed job back in the queue with a fresh set of attempts.
+        """
+        cursor = self.connection.execute(
+            "UPDATE jobs SET status = 'pending', attempts = 0, worker = NULL, lease_until = NULL WHERE status = 'failed'"
+            )
+        return cursor.rowcount
+
+    def counts(self):
+        counts = dict.fromkeys(STATUSES, 0)
+        counts.update(self.connection.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return counts
+
+    def failures(self):
+        return self.connection.execute("SELECT key, attempts, error FROM jobs WHERE status = 'failed' ORDER BY id").fetchall()
+
+    def unfinished(self):
+        """
+        True while there are jobs someone might still run.
+        """
+        counts = self.counts()
+        return counts['pending'] + counts['running'] > 0
+
+
+def _same_replicate(queued, args):
+    # (simulation_id, seed, params, results_dir, log_dir), see run_simulation
+    return queued[1] == args[1] and dict(queued[2]) == dict(args[2]) and queued[4] == args[4]
+
+
+def submit_ensemble(queue, params, number_of_simulations, seed=None, results_dir=MODEL_RUNS_DIR, log_dir=LOG_DIR):
+    """
+    One job per replicate, with the same seeds simulate.py would use. Returns how many were new.
+    Raises ValueError, and queues nothing, if any of the replicates is already queued for
+    `results_dir` with a different seed or parameters (see above).
+    """
+    results_dir = os.path.abspath(results_dir)
+    jobs = [
+        (f'simulation:{results_dir}:{simulation_id}', run_simulation, (simulation_id, replicate_seed, params, results_dir, log_dir))
+        for simulation_id, replicate_seed in enumerate(replicate_seeds(seed, number_of_simulations))
+        ]
+    return queue.submit_all(jobs, same=_same_replicate)
+
+
+def submit_sweep(queue, spec, params=None, cache_dir=CACHE_DIR):
+    """
+    One job per sweep run that isn't cached yet. Returns the sweep's index (see sweep.plan_sweep)
+    and how many jobs were new.
+    """
+    index, pending = plan_sweep(spec, params, cache_dir)
+    added = 0
+    for key, (point_params, seed, replicate) in pending.items():
+        added += queue.submit(f'sweep:{key}', run_point, key, point_params, seed, replicate, cache_dir)
+    return index, added
+
+
+class _Lease(threading.Thread):
+    """
+    Renews a worker's lease on a job in the background while the job runs.
+    """
+    def __init__(self, path, job_id, worker, lease):
+        super().__init__(daemon=True)
+        self.path = path
+        self.job_id = job_id
+        self.worker = worker
+        self.lease = lease
+        self.stopped = threading.Event()
+
+    def run(self):
+        # sqlite connections can't be shared across threads, this one gets its own
+        queue = WorkQueue(self.path)
+        try:
+            while not self.stopped.wait(self.lease / 3):
+                if not queue.renew(self.job_id, self.worker, self.lease):
+                    break
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def work(path=QUEUE_PATH, worker=None, lease=60, poll=5, wait=False):
+    """
+    Claim and run jobs until the queue has nothing left to run (with `wait`, until it's killed).
+    Returns how many jobs this worker finished.
+    """
+    worker = worker or f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    queue = WorkQueue(path)
+    finished = 0
+    try:
+        while True:
+            job = queue.claim(worker, lease)
+            if job is None:
+                if not wait and not queue.unfinished():
+                    return finished
+                # others are still running jobs that might come back to the queue
+                time.sleep(poll)
+                continue
+            job_id, function, args = job
+            renewal = _Lease(path, job_id, worker, lease)
+            renewal.start()
+            try:
+                function(*args)
+            except Exception:
+                renewal.stop()
+                queue.fail(job_id, worker, traceback.format_exc())
+                print(f'{worker}: job {job_id} failed', file=sys.stderr)
+                continue
+            renewal.stop()
+            queue.complete(job_id, worker)
+            finished += 1
+            print(f'{worker}: job {job_id} done')
+    finally:
+        queue.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run replicates through a shared SQLite work queue.')
+    parser.add_argument('--db', default=QUEUE_PATH, help=f'queue database (default: {QUEUE_PATH})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    submit = commands.add_parser('submit', help='queue the ensemble in parameters.yaml, or a sweep')
+    submit.add_argument('--sweep', help='sweep spec (yaml) to queue instead of the ensemble')
+    submit.add_argument('--max-attempts', type=int, default=3, help='tries per job before it counts as failed')
+    worker = commands.add_parser('work', help='run jobs until the queue is empty')
+    worker.add_argument('--processes', type=int, default=1, help='worker processes to start on this machine')
+    worker.add_argument('--lease', type=float, default=60, help='seconds a claim lasts without renewal')
+    worker.add_argument('--wait', action='store_true', help='keep waiting for new jobs instead of exiting')
+    commands.add_parser('status', help='count jobs by status and show the failures')
+    commands.add_parser('retry', help='put failed jobs back in the queue')
+    args = parser.parse_args(argv)
+
+    if args.command == 'work':
+        if args.processes == 1:
+            work(args.db, lease=args.lease, wait=args.wait)
+            return
+        processes = [
+            multiprocessing.Process(target=work, args=(args.db,), kwargs={'lease': args.lease, 'wait': args.wait})
+            for _ in range(args.processes)
+            ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return
+
+    queue = WorkQueue(args.db, max_attempts=getattr(args, 'max_attempts', 3))
+    try:
+        if args.command == 'submit':
+            params = load_config()
+            if args.sweep:
+                with open(args.sweep) as file:
+                    spec = yaml.safe_load(file)
+                try:
+                    index, added = submit_sweep(queue, spec, params)
+                except ValueError as e:
+                    print(f'Not queued: {e}', file=sys.stderr)
+                    return 1
+                name = os.path.splitext(os.path.basename(args.sweep))[0]
+                path = os.path.join(os.path.dirname(CACHE_DIR), name, 'index.csv')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                index.to_csv(path, index=False)
+                print(f'{len(index)} runs, {added} queued, index: {path}')
+            else:
+                seed = params['seed'] if params['seed'] is not None else np.random.SeedSequence().entropy
+                try:
+                    added = submit_ensemble(queue, params, params['number_of_simulations'], seed)
+                except ValueError as e:
+                    hint = '' if params['seed'] is not None else ' (no seed in parameters.yaml, so every submit draws a new one)'
+                    print(f'Not queued: {e}{hint}', file=sys.stderr)
+                    return 1
+                print(f"{params['number_of_simulations']} replicates (seed {seed}), {added} queued")
+        elif args.command == 'retry':
+            print(f'{queue.retry_failed()} failed jobs queued again')
+        print(queue.counts())
+        for key, attempts, error in queue.failures():
+            print(f'\n{key} failed after {attempts} attempts:\n{error}')
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())